@@ -1,6 +1,8 @@
 # arg 1 = ip or FQDN
 # arg 2 = default port 80, else hint
 # validate with HEAD, not GET
+# -c <count> probes on one pooled keep-alive session, -i <seconds> between them
+# --compare alternates cold & reused connections to show what keep-alive saves
 
 ## exception:
 # invalid usage if no arg, exit code 1
@@ -11,30 +13,268 @@
 
 
 import sys
+import time
+import socket
+import statistics
 import requests as q
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
 
 
-if len(sys.argv) not in [2, 3]:
-	print("Improper number of arguments: at least one is required and not more than two are allowed:\n- http server's address (required)\n- port number (defaults to 80 if not specified)\n")
-	sys.exit(1)
+USAGE = (
+	"Improper number of arguments: at least one is required and not more than two are allowed:\n"
+	"- http server's address (required)\n"
+	"- port number (defaults to 80 if not specified)\n"
+	"Options for repeated probes:\n"
+	"- -c <count>     number of probes on one keep-alive session (default: 1)\n"
+	"- -i <seconds>   wait between probes (default: 1)\n"
+	"- --compare      alternate cold & reused connections and show the keep-alive gain\n"
+)
 
-host = sys.argv[1]
+# seconds to wait for the server
+TIMEOUT = 3
 
-if len(sys.argv) == 2:
-	port = 80
-else:
-	port = int(sys.argv[2])
-	if port not in range(1,65536):
-		print("Port number is invalid - exiting")
-		sys.exit(2)
+# probes go one after the other to a single host, so one pool holding one kept connection is all
+# reuse needs, anything bigger only keeps idle sockets open on the server
+POOL_CONNECTIONS = 1
+POOL_SIZE = 1
 
-try:
-	req = q.head('http://localhost:3000/cars', verify=False, timeout=3)
+# exit codes
+USAGE_ERROR, PORT_ERROR, TIMEOUT_ERROR, CONNECTION_ERROR = 1, 2, 3, 4
 
-except q.exceptions.Timeout as t:
-	print('TimeoutError after 3 seconds')
-	sys.exit(3)
+PHASES = ("dns", "connect", "tls", "first_byte")
 
-except q.exceptions.ConnectionError as conn_ex:
-	print(repr(conn_ex()))
-	sys.exit(4)
+# certificates are not verified, as before, so do not warn about it on every probe
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+class TimedConnection:
+	"""
+	Connection mixin noting DNS, connect & TLS seconds into the phases dict of its adapter
+	"""
+	phases = None
+
+	def _new_conn(self):
+		start = time.perf_counter()
+		name = self._dns_host
+		try:
+			addresses = list(dict.fromkeys(
+				info[4][0] for info in socket.getaddrinfo(name, self.port, type=socket.SOCK_STREAM)
+			))
+		except socket.gaierror:
+			# let urllib3 report the failure
+			addresses = [name]
+		resolved = time.perf_counter()
+		try:
+			# every address in turn, as urllib3 would, the first that connects wins
+			for address in addresses:
+				self._dns_host = address
+				try:
+					sock = super()._new_conn()
+					break
+				except (NewConnectionError, ConnectTimeoutError):
+					if address == addresses[-1]:
+						raise
+		finally:
+			# the name is still needed for TLS
+			self._dns_host = name
+		self.phases["dns"] = resolved - start
+		self.phases["connect"] = time.perf_counter() - resolved
+		return sock
+
+	def connect(self):
+		start = time.perf_counter()
+		super().connect()
+		if isinstance(self, HTTPSConnection):
+			self.phases["tls"] = time.perf_counter() - start - self.phases["dns"] - self.phases["connect"]
+
+
+class TimedAdapter(HTTPAdapter):
+	"""
+	Keep-alive adapter whose new connections note how long opening them took
+	phases is emptied before each probe, so it stays empty when a kept connection was reused
+	"""
+
+	def __init__(self, **kwargs):
+		self.phases = {}
+		super().__init__(**kwargs)
+
+	def init_poolmanager(self, *args, **kwargs):
+		super().init_poolmanager(*args, **kwargs)
+		timed = {"phases": self.phases}
+		self.poolmanager.pool_classes_by_scheme = {
+			"http": type("TimedHTTPConnectionPool", (HTTPConnectionPool,), {
+				"ConnectionCls": type("TimedHTTPConnection", (TimedConnection, HTTPConnection), timed)
+			}),
+			"https": type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,), {
+				"ConnectionCls": type("TimedHTTPSConnection", (TimedConnection, HTTPSConnection), timed)
+			}),
+		}
+
+
+def new_session():
+	session = q.Session()
+	adapter = TimedAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_SIZE)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+
+def parse_args(argv):
+	"""
+	:return: host, port & options, exit with code 1 on bad usage & 2 on a bad port
+	"""
+	opts = {"count": 1, "interval": 1.0, "compare": False}
+	args = []
+	flags = {"-c": ("count", int), "-i": ("interval", float)}
+	z = 0
+	while z < len(argv):
+		if argv[z] == "--compare":
+			opts["compare"] = True
+		elif argv[z] in flags:
+			name, kind = flags[argv[z]]
+			try:
+				opts[name] = kind(argv[z + 1])
+			except (IndexError, ValueError):
+				print(USAGE)
+				sys.exit(USAGE_ERROR)
+			z += 1
+		else:
+			args.append(argv[z])
+		z += 1
+
+	if len(args) not in [1, 2] or opts["count"] < 1:
+		print(USAGE)
+		sys.exit(USAGE_ERROR)
+
+	host = args[0]
+
+	if len(args) == 1:
+		port = 80
+	else:
+		port = int(args[1]) if args[1].isdigit() else 0
+		if port not in range(1, 65536):
+			print("Port number is invalid - exiting")
+			sys.exit(PORT_ERROR)
+	return host, port, opts
+
+
+def target_url(host, port):
+	scheme = "https" if port == 443 else "http"
+	if ":" in host:
+		host = f"[{host}]"
+	return f"{scheme}://{host}:{port}/"
+
+
+def probe(session, url):
+	"""
+	One HEAD request on a kept connection when the pool has one, else on a new one
+	:return: status line, whether the connection was reused & ms of every phase plus the total
+	"""
+	phases = session.get_adapter(url).phases
+	phases.clear()
+	start = time.perf_counter()
+	req = session.head(url, verify=False, timeout=TIMEOUT)
+	total = time.perf_counter() - start
+
+	reused = not phases
+	timings = {phase: phases.get(phase, 0.0) * 1000 for phase in PHASES[:-1]}
+	# elapsed runs from sending until the headers are in, connection set up included
+	timings["first_byte"] = max(0.0, req.elapsed.total_seconds() * 1000 - sum(timings.values()))
+	timings["total"] = total * 1000
+	version = req.raw.version
+	return f"HTTP/{version // 10}.{version % 10} {req.status_code} {req.reason}", reused, timings
+
+
+def summary(name, results, tls=True):
+	"""
+	Averages of one group of probes, connection set up over the probes that opened one
+	"""
+	if not results:
+		return f"{name:>7}: no replies"
+	opened = [t for reused, t in results if not reused]
+	first_byte = statistics.mean(t["first_byte"] for _, t in results)
+	total = statistics.median(t["total"] for _, t in results)
+	line = f"{name:>7}: {len(results)} probes, {len(results) - len(opened)} reused, "
+	if opened:
+		setup = PHASES[:-1] if tls else PHASES[:-2]
+		phases = "/".join(f"{statistics.mean(t[phase] for t in opened):.2f}" for phase in setup)
+		line += f"{'/'.join(setup)} avg = {phases} ms, "
+	return line + f"first byte avg = {first_byte:.2f} ms, total median = {total:.2f} ms"
+
+
+def ping(host, port, count, interval, compare=False):
+	"""
+	Probes on one pooled session, with --compare every other probe first drops the kept connection
+	:return: 0 if any probe got a reply, else the exit code of the last failure
+	"""
+	url = target_url(host, port)
+	groups = {"cold": [], "reused": []} if compare else {"all": []}
+	failure = 0
+	with new_session() as session:
+		adapter = session.get_adapter(url)
+		try:
+			for seq in range(1, count + 1):
+				if seq > 1:
+					time.sleep(interval)
+				cold = compare and seq % 2 == 1
+				if cold:
+					adapter.poolmanager.clear()
+				try:
+					status, reused, timings = probe(session, url)
+				except q.exceptions.Timeout:
+					print(f"seq={seq} TimeoutError after {TIMEOUT} seconds")
+					failure = TIMEOUT_ERROR
+					continue
+				except q.exceptions.ConnectionError as conn_ex:
+					print(f"seq={seq} {conn_ex!r}")
+					failure = CONNECTION_ERROR
+					continue
+				groups["cold" if cold else "reused" if compare else "all"].append((reused, timings))
+				opened = "reused" if reused else (
+					f"dns={timings['dns']:.2f} connect={timings['connect']:.2f}"
+					+ (f" tls={timings['tls']:.2f}" if url.startswith("https") else "")
+				)
+				print(
+					f"{url} seq={seq} {opened} first_byte={timings['first_byte']:.2f} "
+					f"total={timings['total']:.2f} ms {status}"
+				)
+		except KeyboardInterrupt:
+			pass
+
+	print(f"\n--- {url} probe statistics ---")
+	for name, results in groups.items():
+		print(summary(name, results, url.startswith("https")))
+
+	if compare and groups["cold"] and groups["reused"]:
+		cold = statistics.median(t["total"] for _, t in groups["cold"])
+		warm = statistics.median(t["total"] for _, t in groups["reused"])
+		print(f"keep-alive gain: {cold - warm:.2f} ms per probe ({(cold - warm) / cold:.1%} of a cold probe)")
+		reconnected = sum(1 for reused, _ in groups["reused"] if not reused)
+		if reconnected:
+			print(f"the server dropped {reconnected} of {len(groups['reused'])} kept connections - check its keep-alive settings")
+	return 0 if any(groups.values()) else failure
+
+
+if __name__ == "__main__":
+	host, port, opts = parse_args(sys.argv[1:])
+
+	# single probe, as before: print the status line or exit with the error code
+	if opts["count"] == 1 and not opts["compare"]:
+		try:
+			with new_session() as session:
+				status, _, _ = probe(session, target_url(host, port))
+			print(status)
+
+		except q.exceptions.Timeout as t:
+			print('TimeoutError after ' + str(TIMEOUT) + ' seconds')
+			sys.exit(TIMEOUT_ERROR)
+
+		except q.exceptions.ConnectionError as conn_ex:
+			print(repr(conn_ex))
+			sys.exit(CONNECTION_ERROR)
+	else:
+		sys.exit(ping(host, port, **opts))
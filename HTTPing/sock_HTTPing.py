@@ -1,44 +1,426 @@
 import sys
 import socket
+import math
+import time
+import json
+import asyncio
 
 import pdb
 
-# print usage on invalid execution, exit code 1
-if len(sys.argv) not in [2, 3]:
-    print("Improper number of arguments: at least one is required and not more than two are allowed:\n- http server's address (required)\n- port number (defaults to 80 if not specified)\n")
-    sys.exit(1)
-
-
-# arg 1 = ip or hostname 
-host = sys.argv[1]
-
-#pdb.set_trace()
-# arg 2 = default port 80, else hint
-if len(sys.argv) == 2:
-    port = 80
-else:
-    port = int(sys.argv[2])
-    if port not in range(1,65536):
-        print("Port number is invalid - exiting")
-        sys.exit(2)
-
-try:
-	# set TCP connection
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as z:
-        z.connect((host, port))
-        z.sendall(b"HEAD / HTTP/1.1\r\nHost: localhost\r\n\Accept: text/html\r\n\r\n")
-		# get the response
-        reply = str(z.recv(1024), 'utf-8')
-
-		# retrieve brief status
-        ok_conn = str(reply.splitlines()[0])
-        ok_conn = ok_conn.replace("'", '').replace('b', '')
-        print(ok_conn)
-
-except socket.timeout as t:
-    print('TimeoutError after ' + str(sock.gettimeout()) + ' seconds')
-    sys.exit(3)
-
-except:
-    print(sys.exc_info())
-    sys.exit(4)
+USAGE = (
+    "Improper number of arguments: at least one is required and not more than two are allowed:\n"
+    "- http server's address (required)\n"
+    "- port number (defaults to 80 if not specified)\n"
+    "Options for a continuous ping:\n"
+    "- -c <count>     number of probes (default: 1, 0 pings until interrupted)\n"
+    "- -i <seconds>   wait between probes (default: 1)\n"
+    "- -w <seconds>   stop after this long whatever the count\n"
+    "- -k             reuse one keep-alive connection, so connect time is paid once\n"
+    "Or probe many servers at once, one JSON line per target:\n"
+    "- -f <file>      targets as host[:port], one per line, - reads stdin\n"
+    "- -j <count>     probes in flight (default: 100)\n"
+    "- -t <seconds>   timeout of each probe (default: 3)\n"
+)
+
+# seconds to wait for the server on every step of a probe
+TIMEOUT = 3
+
+# exit codes, also the per-target codes of a multi-target scan
+USAGE_ERROR, PORT_ERROR, TIMEOUT_ERROR, CONNECTION_ERROR = 1, 2, 3, 4
+
+# probes in flight during a multi-target scan
+CONCURRENCY = 100
+
+
+class LatencyHistogram:
+    """
+    Latency statistics in fixed memory
+    min/avg/max/stddev are kept as running sums, percentiles come from log-spaced buckets
+    each GROWTH wider than the previous, so any percentile is off by GROWTH at most
+    """
+    GROWTH = 1.05
+    # 1 microsecond up to ~ 100 seconds
+    LOWEST = 0.001
+    BUCKETS = 400
+
+    def __init__(self):
+        self.buckets = [0] * LatencyHistogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, ms: float):
+        self.count += 1
+        self.total += ms
+        self.squares += ms * ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+        ndx = 0
+        if ms > LatencyHistogram.LOWEST:
+            ndx = math.ceil(math.log(ms / LatencyHistogram.LOWEST, LatencyHistogram.GROWTH))
+        self.buckets[min(ndx, LatencyHistogram.BUCKETS - 1)] += 1
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        if not self.count:
+            return 0.0
+        return math.sqrt(max(0.0, self.squares / self.count - self.avg ** 2))
+
+    def percentile(self, p: float) -> float:
+        """
+        Upper bound of the bucket holding the p-th percentile, capped by the real maximum
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(p / 100 * self.count)
+        seen = 0
+        for ndx, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= rank:
+                return min(LatencyHistogram.LOWEST * LatencyHistogram.GROWTH ** ndx, self.max)
+        return self.max
+
+    def summary(self) -> str:
+        return (
+            f"min/avg/max/sd = {self.min:.2f}/{self.avg:.2f}/{self.max:.2f}/{self.stddev:.2f} ms, "
+            f"p50/p90/p99 = {self.percentile(50):.2f}/{self.percentile(90):.2f}/{self.percentile(99):.2f} ms"
+        )
+
+
+def parse_args(argv: list[str]):
+    """
+    :return: host, port & options, exit with code 1 on bad usage & 2 on a bad port
+    """
+    opts = {"count": 1, "interval": 1.0, "deadline": None, "keepalive": False}
+    args = []
+    flags = {"-c": ("count", int), "-i": ("interval", float), "-w": ("deadline", float)}
+    z = 0
+    while z < len(argv):
+        if argv[z] == "-k":
+            opts["keepalive"] = True
+        elif argv[z] in flags:
+            name, kind = flags[argv[z]]
+            try:
+                opts[name] = kind(argv[z + 1])
+            except (IndexError, ValueError):
+                print(USAGE)
+                sys.exit(USAGE_ERROR)
+            z += 1
+        else:
+            args.append(argv[z])
+        z += 1
+
+    # print usage on invalid execution, exit code 1
+    if len(args) not in [1, 2]:
+        print(USAGE)
+        sys.exit(USAGE_ERROR)
+
+    # arg 1 = ip or hostname
+    host = args[0]
+
+    # arg 2 = default port 80, else hint
+    if len(args) == 1:
+        port = 80
+    else:
+        port = int(args[1]) if args[1].isdigit() else 0
+        if port not in range(1, 65536):
+            print("Port number is invalid - exiting")
+            sys.exit(PORT_ERROR)
+    return host, port, opts
+
+
+def parse_scan_args(argv: list[str]):
+    """
+    :return: target file, concurrency & per-probe timeout, exit with code 1 on bad usage
+    """
+    opts = {"source": None, "concurrency": CONCURRENCY, "timeout": TIMEOUT}
+    flags = {"-f": ("source", str), "-j": ("concurrency", int), "-t": ("timeout", float)}
+    if len(argv) % 2:
+        print(USAGE)
+        sys.exit(USAGE_ERROR)
+    for flag, value in zip(argv[::2], argv[1::2]):
+        try:
+            name, kind = flags[flag]
+            opts[name] = kind(value)
+        except (KeyError, ValueError):
+            print(USAGE)
+            sys.exit(USAGE_ERROR)
+    if opts["concurrency"] < 1 or opts["timeout"] <= 0:
+        print(USAGE)
+        sys.exit(USAGE_ERROR)
+    return opts
+
+
+def parse_target(target: str):
+    """
+    host[:port], IPv6 addresses in brackets when a port is given
+    :return: host, port & 0, or the code of what is wrong with the target
+    """
+    host, port = target, "80"
+    if target.startswith("["):
+        host, _, rest = target[1:].partition("]")
+        if rest:
+            if not rest.startswith(":"):
+                return host, 0, USAGE_ERROR
+            port = rest[1:]
+    elif target.count(":") == 1:
+        host, port = target.split(":")
+    if not host:
+        return host, 0, USAGE_ERROR
+    port = int(port) if port.isdigit() else 0
+    if port not in range(1, 65536):
+        return host, port, PORT_ERROR
+    return host, port, 0
+
+
+def host_header(host: str, port: int) -> str:
+    """
+    Authority of the Host header: IPv6 addresses in brackets, the port unless it is 80
+    """
+    if ":" in host:
+        host = f"[{host}]"
+    return host if port == 80 else f"{host}:{port}"
+
+
+async def probe_async(host: str, port: int):
+    """
+    One HEAD request on a connection of its own, the asyncio twin of probe
+    :return: status line & connect/ttfb/total ms
+    """
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        connected = time.perf_counter()
+        writer.write(f"HEAD / HTTP/1.1\r\nHost: {host_header(host, port)}\r\nAccept: text/html\r\nConnection: close\r\n\r\n".encode())
+        # the status line is all that is needed
+        status = await reader.readline()
+        first_byte = time.perf_counter()
+    finally:
+        writer.close()
+    if not status:
+        raise ConnectionError("Connection closed without a reply")
+    return status.rstrip(b"\r\n").decode("utf-8", "replace"), (
+        (connected - start) * 1000,
+        (first_byte - connected) * 1000,
+        (first_byte - start) * 1000,
+    )
+
+
+async def scan_targets(targets, concurrency: int = CONCURRENCY, timeout: float = TIMEOUT):
+    """
+    Probe every target with at most concurrency probes in flight
+    Yield one result dict per target in order of completion, code 0 means the server replied
+    """
+    results = asyncio.Queue(maxsize=concurrency)
+    todo = iter(targets)
+
+    async def work():
+        # every worker pulls the next target until none is left
+        try:
+            for target in todo:
+                target = target.strip()
+                if not target or target.startswith("#"):
+                    continue
+                host, port, code = parse_target(target)
+                result = {"target": target, "host": host, "port": port, "code": code}
+                if not code:
+                    try:
+                        async with asyncio.timeout(timeout):
+                            status, timings = await probe_async(host, port)
+                    except TimeoutError:
+                        result.update(code=TIMEOUT_ERROR, error=f"TimeoutError after {timeout} seconds")
+                    except Exception as err:
+                        # bad names fail in IDNA encoding before any connection, report them all the same
+                        result.update(code=CONNECTION_ERROR, error=repr(err))
+                    else:
+                        result["status"] = status
+                        result.update(zip(("connect_ms", "ttfb_ms", "total_ms"), (round(ms, 3) for ms in timings)))
+                else:
+                    result["error"] = "invalid port" if code == PORT_ERROR else "invalid target"
+                # blocks while the reader is behind
+                await results.put(result)
+        finally:
+            # the reader counts these, a worker that dies without one would stall it
+            await results.put(None)
+
+    workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        running = len(workers)
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+                continue
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def scan(targets, out=sys.stdout, concurrency: int = CONCURRENCY, timeout: float = TIMEOUT) -> int:
+    """
+    Write one JSON line per target to out & a tally of the codes to stderr
+    :return: 0 if every target replied, else the highest per-target code
+    """
+    codes = {}
+    start = time.perf_counter()
+    async for result in scan_targets(targets, concurrency, timeout):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        codes[result["code"]] = codes.get(result["code"], 0) + 1
+    took = time.perf_counter() - start
+    tally = ", ".join(f"code {code}: {hits}" for code, hits in sorted(codes.items()))
+    print(f"{sum(codes.values())} targets in {took:.2f} seconds ({tally or 'none'})", file=sys.stderr)
+    return max(codes, default=0)
+
+
+def probe(host: str, port: int, conn: socket.socket = None, keepalive: bool = False):
+    """
+    One HEAD request, on conn when given, else on a new connection
+    With keepalive the server is asked to keep the connection open for the next probe
+    A kept connection the server has dropped since is replaced once, not counted as a failure
+    :return: status line, connect/ttfb/total ms, the connection when it stays open & whether conn was reused
+    """
+    reused = conn is not None
+    start = time.perf_counter()
+    if conn is None:
+        conn = socket.create_connection((host, port), timeout=TIMEOUT)
+    connected = time.perf_counter()
+
+    request = (
+        f"HEAD / HTTP/1.1\r\nHost: {host_header(host, port)}\r\nAccept: text/html\r\n"
+        f"Connection: {'keep-alive' if keepalive else 'close'}\r\n\r\n"
+    )
+    try:
+        conn.sendall(request.encode())
+        # get the response
+        reply = conn.recv(1024)
+    except (ConnectionResetError, BrokenPipeError):
+        if not reused:
+            conn.close()
+            raise
+        reply = b""
+    first_byte = time.perf_counter()
+    while reply and b"\r\n\r\n" not in reply:
+        more = conn.recv(1024)
+        if not more:
+            break
+        reply += more
+    done = time.perf_counter()
+
+    if not reply:
+        conn.close()
+        if reused:
+            # idle timeout or a server that closes after every reply
+            status, timings, conn, _ = probe(host, port, None, keepalive)
+            return status, timings, conn, False
+        raise ConnectionError("Connection closed without a reply")
+    # retrieve brief status
+    head = reply.split(b"\r\n\r\n", 1)[0]
+    lines = head.split(b"\r\n")
+    status = lines[0].decode("utf-8", "replace")
+    connection = b""
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"connection":
+            connection = value.strip().lower()
+    # HTTP/1.0 closes unless it says otherwise, HTTP/1.1 keeps unless it says otherwise
+    if status.startswith("HTTP/1.0"):
+        closing = connection != b"keep-alive"
+    else:
+        closing = connection == b"close"
+    closing = closing or not keepalive
+    if closing:
+        conn.close()
+    return status, (
+        (connected - start) * 1000,
+        (first_byte - connected) * 1000,
+        (done - start) * 1000,
+    ), None if closing else conn, reused
+
+
+def ping(host: str, port: int, count: int, interval: float, deadline: float = None, keepalive: bool = False) -> int:
+    """
+    httping style loop printing each probe & the statistics at the end
+    :return: 0 if any probe got a reply, else the exit code of the last failure
+    """
+    phases = {"connect": LatencyHistogram(), "ttfb": LatencyHistogram(), "total": LatencyHistogram()}
+    stop_at = time.monotonic() + deadline if deadline else math.inf
+    conn, sent, failure = None, 0, 0
+    try:
+        while (not count or sent < count) and time.monotonic() < stop_at:
+            if sent:
+                time.sleep(max(0.0, min(interval, stop_at - time.monotonic())))
+            sent += 1
+            try:
+                status, timings, conn, reused = probe(host, port, conn, keepalive)
+            except socket.timeout:
+                print(f"seq={sent} TimeoutError after {TIMEOUT} seconds")
+                failure, conn = TIMEOUT_ERROR, None
+            except OSError as err:
+                print(f"seq={sent} {err!r}")
+                failure, conn = CONNECTION_ERROR, None
+            else:
+                connect_ms, ttfb_ms, total_ms = timings
+                # a reused connection has no connect phase
+                if not reused:
+                    phases["connect"].record(connect_ms)
+                phases["ttfb"].record(ttfb_ms)
+                phases["total"].record(total_ms)
+                print(
+                    f"{host}:{port} seq={sent} {'reused' if reused else f'connect={connect_ms:.2f}'} "
+                    f"ttfb={ttfb_ms:.2f} total={total_ms:.2f} ms {status}"
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if conn is not None:
+            conn.close()
+
+    ok = phases["total"].count
+    print(f"\n--- {host}:{port} ping statistics ---")
+    print(f"{sent} probes, {ok} ok, {(sent - ok) / sent if sent else 0:.1%} failed")
+    for name, hist in phases.items():
+        if hist.count:
+            print(f"{name:>7}: {hist.summary()}")
+    return 0 if ok else failure
+
+
+if __name__ == "__main__":
+    # many targets at once
+    if "-f" in sys.argv[1:]:
+        opts = parse_scan_args(sys.argv[1:])
+        source = opts.pop("source")
+        if source == "-":
+            sys.exit(asyncio.run(scan(sys.stdin, **opts)))
+        try:
+            with open(source) as targets:
+                sys.exit(asyncio.run(scan(targets, **opts)))
+        except OSError as err:
+            print(err)
+            sys.exit(USAGE_ERROR)
+
+    host, port, opts = parse_args(sys.argv[1:])
+
+    # single probe, as before: print the status line or exit with the error code
+    if opts["count"] == 1 and opts["deadline"] is None:
+        try:
+            # set TCP connection
+            status, _, _, _ = probe(host, port)
+            print(status)
+
+        except socket.timeout as t:
+            print('TimeoutError after ' + str(TIMEOUT) + ' seconds')
+            sys.exit(TIMEOUT_ERROR)
+
+        except:
+            print(sys.exc_info())
+            sys.exit(CONNECTION_ERROR)
+    else:
+        sys.exit(ping(host, port, **opts))
@@ -8,8 +8,19 @@ My very own ASCII LED display.
   #  #### ####     # #### ####   #   ##### ##### #####
 
 Usage: python LED_display.py <any sequence of numbers or number groups separated by space>
+       python LED_display.py --live clock|counter|tail [fps]
+       (tail shows the last number of every line read from stdin)
+       python LED_display.py --wrap <glyphs per band> < digits.txt
+       (streams numbers of any length from stdin in bands of glyphs)
+       Hex digits A - F, ":" & "-" are drawn too
+       Add --height <rows> and/or --width <factor> to any of the above to scale the font
 """
 
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
 from os import system
 from platform import platform
 from sys import argv
@@ -28,24 +39,283 @@ digitz = {
     '9': ['#####', '#   #', '#####', '    #', '#####'],
     ' ': [3 * ' ' for x in range(5)]
 }
+hex_digitz = {
+    'A': ['#####', '#   #', '#####', '#   #', '#   #'],
+    'B': ['#### ', '#   #', '#### ', '#   #', '#### '],
+    'C': ['#####', '#    ', '#    ', '#    ', '#####'],
+    'D': ['#### ', '#   #', '#   #', '#   #', '#### '],
+    'E': ['#####', '#    ', '#### ', '#    ', '#####'],
+    'F': ['#####', '#    ', '#### ', '#    ', '#    '],
+}
+clock_digitz = {
+    ':': [' ', '#', ' ', '#', ' '],
+    '-': ['   ', '   ', '###', '   ', '   '],
+}
+# every glyph set, lower case hex digits drawn like upper case
+all_digitz = {
+    **digitz,
+    **hex_digitz,
+    **{key.lower(): glyph for key, glyph in hex_digitz.items()},
+    **clock_digitz,
+}
+
+# scaled glyphs kept in memory
+GLYPH_CACHE_SIZE = 512
+
+
+# characters read from stdin at once & glyphs per band when streaming
+READ_SIZE = 64 * 1024
+WINDOW = 40
+
+
+class GlyphSet:
+    """
+    Pre-rendered rows of every glyph of a digit map, one str.translate table per display row,
+    so a whole row of any text is built in a single pass
+    """
+    def __init__(self, digit_map, gap='  '):
+        self.gap = gap
+        self.height = len(next(iter(digit_map.values())))
+        self.tables = [
+            str.maketrans({digit_key: glyph[z] + gap for digit_key, glyph in digit_map.items()})
+            for z in range(self.height)
+        ]
+        # anything the map cannot draw, e.g. newlines of a file
+        self.unknown = re.compile('[^' + re.escape(''.join(digit_map)) + ']')
+
+    def rows(self, text):
+        """
+        The display rows of a text, glyphs separated by the gap
+        ValueError for a character the map cannot draw, translate would copy it into every row
+        """
+        unknown = self.unknown.search(text)
+        if unknown:
+            raise ValueError(f'cannot display {unknown.group()!r}')
+        if not text:
+            return [''] * self.height
+        cut = len(self.gap)
+        return [text.translate(table)[:-cut] if cut else text.translate(table) for table in self.tables]
+
+    def stream(self, chunks, window=WINDOW):
+        """
+        Rows of consecutive windows of glyphs from an iterable of text chunks,
+        memory stays bounded whatever the length of the whole text
+        """
+        pending = ''
+        for chunk in chunks:
+            text = pending + self.unknown.sub('', chunk)
+            start = 0
+            while len(text) - start >= window:
+                yield self.rows(text[start:start + window])
+                start += window
+            pending = text[start:]
+        if pending:
+            yield self.rows(pending)
+
+
+def sample_indexes(old_size: int, size: int, lit: list[bool]) -> list[int]:
+    """
+    Source row (or column) under the centre of each of size target ones
+    A lit source line no target lands on takes over the target holding its centre if that one is blank,
+    so thin strokes like the dots of ':' survive shrinking
+    """
+    picks = [(2 * z + 1) * old_size // (2 * size) for z in range(size)]
+    for src in set(range(old_size)) - set(picks):
+        target = (2 * src + 1) * size // (2 * old_size)
+        if lit[src] and not lit[picks[target]]:
+            picks[target] = src
+    return picks
+
+
+@lru_cache(maxsize=GLYPH_CACHE_SIZE)
+def scaled_glyph(glyph: tuple[str, ...], scale: tuple[int, float]) -> tuple[str, ...]:
+    """
+    Rasterize a glyph to (height in rows, width factor), sampling the source cell under each target cell's centre
+    Each glyph & scale pair is computed once, the least recently used ones are dropped
+    """
+    height, width_scale = scale
+    old_height, old_width = len(glyph), max(len(row) for row in glyph)
+    width = max(1, round(old_width * width_scale))
+    padded = [row.ljust(old_width) for row in glyph]
+    lit_rows = [bool(row.strip()) for row in padded]
+    rows = [padded[z] for z in sample_indexes(old_height, height, lit_rows)]
+    lit_cols = [any(row[q] != ' ' for row in rows) for q in range(old_width)]
+    cols = sample_indexes(old_width, width, lit_cols)
+    return tuple(''.join(row[q] for q in cols) for row in rows)
+
 
+def scaled_glyph_set(digit_map, height=5, width_scale=None):
+    """
+    GlyphSet of a digit map scaled to height rows, widths keep the aspect ratio unless width_scale is given
+    """
+    if width_scale is None:
+        width_scale = height / len(next(iter(digit_map.values())))
+    scale = (height, width_scale)
+    scaled = {key: list(scaled_glyph(tuple(glyph), scale)) for key, glyph in digit_map.items()}
+    return GlyphSet(scaled, gap=' ' * max(1, round(2 * width_scale)))
 
-def led(digit_map, digit_arg):
+
+def led(digit_map, digit_arg, glyphs=None):
     """
     Build each digit line by line, including the space
+    glyphs overrides the digit map with a ready GlyphSet, e.g. a scaled one
     """
     todo = ' '.join(digit_arg)
 
+    # each row in one go, before clearing so a character that cannot be drawn leaves the screen alone
+    rows = (glyphs or GlyphSet(digit_map)).rows(todo)
+
     # clear screen to display in the same area
     system('cls') if 'Windows' in current_os else system('clear')
 
-    # each digit has a height of 5 '#'
-    for z in range(5):
-        for ndx, digit_key in enumerate(todo):
-            if ndx == len(todo) - 1:
-                print(digit_map[digit_key][z])
-            else:
-                print(digit_map[digit_key][z], end="  ")
+    print('\n'.join(rows))
+
+
+def led_stream(digit_map, stream=sys.stdin, window=WINDOW, out=sys.stdout, glyphs=None):
+    """
+    Display a text of any length read from a stream, in bands of window glyphs
+    """
+    glyphs = glyphs or GlyphSet(digit_map)
+    for rows in glyphs.stream(iter(lambda: stream.read(READ_SIZE), ''), window):
+        out.write('\n'.join(rows) + '\n\n')
+
+
+# ANSI escape sequences of the live display
+CSI = '\x1b['
+HIDE_CURSOR = CSI + '?25l'
+SHOW_CURSOR = CSI + '?25h'
+CLEAR_SCREEN = CSI + '2J'
+
+
+class LiveDisplay:
+    """
+    Keep the last frame in memory and redraw only the cells that changed,
+    moving the cursor with ANSI sequences, one write per frame
+    """
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.frame = []
+
+    def draw(self, rows):
+        changes = []
+        if not self.frame:
+            changes.append(HIDE_CURSOR + CLEAR_SCREEN)
+        width = max([len(row) for row in rows + self.frame] or [0])
+        for z in range(max(len(rows), len(self.frame))):
+            new = (rows[z] if z < len(rows) else '').ljust(width)
+            old = (self.frame[z] if z < len(self.frame) else '').ljust(width)
+            col = 0
+            while col < width:
+                if new[col] == old[col]:
+                    col += 1
+                    continue
+                # run of changed cells, written in one go
+                end = col
+                while end < width and new[end] != old[end]:
+                    end += 1
+                changes.append(f'{CSI}{z + 1};{col + 1}H{new[col:end]}')
+                col = end
+        self.frame = [row.rstrip() for row in rows]
+        if changes:
+            self.out.write(''.join(changes))
+            self.out.flush()
+
+    def close(self):
+        # park the cursor below the display
+        self.out.write(f'{CSI}{len(self.frame) + 1};1H{SHOW_CURSOR}\n')
+        self.out.flush()
+
+
+def clock():
+    while True:
+        yield time.strftime('%H:%M:%S')
+
+
+def counter():
+    n = 0
+    while True:
+        yield str(n)
+        n += 1
+
+
+def tail(stream=sys.stdin):
+    """
+    Last number of every line of a metric stream, lines without one are skipped
+    """
+    for line in stream:
+        numbers = [word for word in line.split() if word.lstrip('-').isdigit()]
+        if numbers:
+            yield numbers[-1]
+
+
+def newest(values):
+    """
+    Read an iterator in a background thread & give only the latest value at every step
+    None until the first value is in, ends once the iterator is exhausted & its last value given
+    """
+    latest = [None]
+    done = threading.Event()
+
+    def read():
+        for value in values:
+            latest[0] = value
+        done.set()
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        finished = done.is_set()
+        yield latest[0]
+        if finished:
+            return
+
+
+def live(digit_map, values, fps=30, glyphs=None):
+    """
+    Show the values of an iterator, at most fps frames a second
+    Every value is shown, for a stream that must not fall behind pass it through newest first
+    """
+    display = LiveDisplay()
+    glyphs = glyphs or GlyphSet(digit_map)
+    frame_time = 1 / fps
+    try:
+        for value in values:
+            start = time.perf_counter()
+            if value is not None:
+                display.draw(glyphs.rows(value))
+            # a generated source (the counter) is slowed down to fps
+            time.sleep(max(0.0, frame_time - (time.perf_counter() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        display.close()
+
 
+if __name__ == '__main__':
+    # pull the scaling options out, wherever they are
+    scale = {'--height': 5, '--width': None}
+    for option in scale:
+        if option in argv:
+            ndx = argv.index(option)
+            scale[option] = float(argv[ndx + 1])
+            del argv[ndx:ndx + 2]
+    glyphs = scaled_glyph_set(all_digitz, int(scale['--height']), scale['--width'])
 
-led(digitz, argv[1:])
+    if argv[1:2] == ['--live']:
+        sources = {'clock': clock, 'counter': counter, 'tail': tail}
+        source = argv[2] if len(argv) > 2 else 'clock'
+        if source not in sources:
+            print(__doc__)
+            raise SystemExit(1)
+        values = sources[source]()
+        # stdin is read on its own so the display always shows the latest metric
+        if source == 'tail':
+            values = newest(values)
+        live(all_digitz, values, int(argv[3]) if len(argv) > 3 else 30, glyphs)
+    elif argv[1:2] == ['--wrap']:
+        led_stream(all_digitz, window=int(argv[2]) if len(argv) > 2 else WINDOW, glyphs=glyphs)
+    else:
+        try:
+            led(all_digitz, argv[1:], glyphs)
+        except ValueError as err:
+            print(err)
+            raise SystemExit(1)
@@ -1,53 +1,492 @@
 """
 DEMO asynchronous web scraper of talkpython.fm
 Scrape a range of episode numbers
+
+Usage: python async_scrape.py [episodes, e.g. 190-199 250 300-310] [--out titles.jsonl] [--help for more]
 """
 
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import sqlite3
+import time
+from asyncio import AbstractEventLoop
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
 import aiohttp
 import aiodns
 import bs4
 from colorama import Fore
 
 
+BASE_URL = 'https://talkpython.fm'
+
+# connection pool limits shared by every request of a crawl
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+# number of episodes being downloaded at the same time
+MAX_CONCURRENCY = 10
+# processes parsing downloaded pages & size of the download -> parse queue
+PARSE_WORKERS = os.cpu_count() or 1
+QUEUE_SIZE = 50
+# pages kept on disk between runs, least recently used ones go first
+CACHE_PATH = 'talkpython_cache.sqlite3'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# bytes read per step when streaming a page for its header
+CHUNK_SIZE = 8 * 1024
+# attempts per episode across runs & delay before the first retry, doubled each time
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+
 def main():
+    args = parse_args()
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(get_title_range(loop))
+    with PageCache(args.cache) as cache:
+        if args.out:
+            loop.run_until_complete(crawl(
+                loop,
+                args.episodes,
+                args.out,
+                concurrency=args.concurrency,
+                parse_workers=args.workers,
+                cache=cache,
+                stream=args.stream,
+                max_attempts=args.attempts,
+            ))
+        else:
+            loop.run_until_complete(get_title_range(
+                loop,
+                args.episodes,
+                concurrency=args.concurrency,
+                parse_workers=args.workers,
+                cache=cache,
+                stream=args.stream,
+            ))
     print("Done")
 
 
-async def get_html(episode_number: int) -> str:
-    print(Fore.YELLOW + f"Getting HTML for episode {episode_number}", flush=True)
-    
-    url = f'https://talkpython.fm/{episode_number}'
+def parse_episodes(specs: list[str]) -> list[int]:
+    """
+    Turn single numbers & inclusive ranges like 190-199 into a sorted list of episodes
+    """
+    episodes = set()
+    for spec in specs:
+        first, _, last = spec.partition('-')
+        if last:
+            episodes.update(range(int(first), int(last) + 1))
+        else:
+            episodes.add(int(first))
+    return sorted(episodes)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as reply:
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Scrape talkpython.fm episode titles')
+    parser.add_argument(
+        'episodes', nargs='*', default=['190-199'],
+        help='episode numbers or inclusive ranges, e.g. 190-199 250 (default: 190-199)',
+    )
+    parser.add_argument(
+        '--out', help='append titles to this JSONL file & resume from it on the next run',
+    )
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--workers', type=int, default=PARSE_WORKERS, help='parser processes')
+    parser.add_argument('--attempts', type=int, default=MAX_ATTEMPTS, help='tries per episode')
+    parser.add_argument('--cache', default=CACHE_PATH, help='page cache file')
+    parser.add_argument('--stream', action='store_true', help='stop reading each page at its h1')
+    args = parser.parse_args(argv)
+    try:
+        args.episodes = parse_episodes(args.episodes)
+    except ValueError:
+        parser.error('episodes must be numbers or ranges like 190-199')
+    return args
+
+
+class PageCache:
+    """
+    Persistent HTTP cache keyed by URL
+    Store body, ETag & Last-Modified to revalidate pages with conditional requests
+    Evict least recently used pages once the bodies exceed max_bytes
+    """
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS page (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS page_lru ON page (last_used)')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.db.close()
+
+    def get(self, url: str):
+        """
+        :return: (body, etag, last_modified) or None when the URL was never cached
+        """
+        return self.db.execute(
+            'SELECT body, etag, last_modified FROM page WHERE url = ?', (url,)
+        ).fetchone()
+
+    @staticmethod
+    def validators(entry) -> dict:
+        """
+        Conditional request headers for a cached entry
+        """
+        if entry is None:
+            return {}
+        _, etag, last_modified = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def touch(self, url: str):
+        self.db.execute('UPDATE page SET last_used = ? WHERE url = ?', (time.time(), url))
+        self.db.commit()
+
+    def put(self, url: str, body: str, etag: str = None, last_modified: str = None):
+        size = len(body.encode())
+        # a page bigger than the whole cache would only evict everything else
+        if size > self.max_bytes:
+            return
+        self.db.execute(
+            'INSERT OR REPLACE INTO page VALUES (?, ?, ?, ?, ?, ?)',
+            (url, body, etag, last_modified, size, time.time()),
+        )
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM page').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for url, size in self.db.execute('SELECT url, size FROM page ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            stale.append((url,))
+            total -= size
+        self.db.executemany('DELETE FROM page WHERE url = ?', stale)
+
+
+def new_session(
+    limit: int = MAX_CONNECTIONS,
+    limit_per_host: int = MAX_CONNECTIONS_PER_HOST,
+) -> aiohttp.ClientSession:
+    """
+    Build the one session shared by a whole crawl
+    Connections are pooled & kept alive, DNS answers are cached
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        resolver=aiohttp.AsyncResolver(),
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def get_html(
+    session: aiohttp.ClientSession,
+    episode_number: int,
+    semaphore: asyncio.Semaphore,
+    cache: PageCache = None,
+) -> str:
+    # wait for a free slot before opening the request
+    async with semaphore:
+        print(Fore.YELLOW + f"Getting HTML for episode {episode_number}", flush=True)
+
+        url = f'{BASE_URL}/{episode_number}'
+        entry = cache.get(url) if cache is not None else None
+
+        async with session.get(url, headers=PageCache.validators(entry)) as reply:
             reply.raise_for_status()
+            # unchanged since the last run, serve it from disk
+            if reply.status == 304 and entry is not None:
+                cache.touch(url)
+                return entry[0]
+
             html = await reply.text()
+            if cache is not None:
+                cache.put(
+                    url,
+                    html,
+                    reply.headers.get('ETag'),
+                    reply.headers.get('Last-Modified'),
+                )
             return html
 
 
+class HeaderFinder(HTMLParser):
+    """
+    Incremental tokenizer collecting the text of the first h1
+    title stays None until its closing tag has been fed
+    """
+    def __init__(self):
+        super().__init__()
+        self.inside = False
+        self.text = []
+        self.title = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'h1' and self.title is None:
+            self.inside = True
+
+    def handle_endtag(self, tag):
+        if tag == 'h1' and self.inside:
+            self.inside = False
+            self.title = ''.join(self.text).strip()
+
+    def handle_data(self, data):
+        if self.inside:
+            self.text.append(data)
+
+
+async def get_title_streamed(
+    session: aiohttp.ClientSession,
+    episode_number: int,
+    semaphore: asyncio.Semaphore,
+):
+    """
+    Read the page chunk by chunk & stop at the end of the first h1
+    The page cache is bypassed, a page read only up to its header cannot be stored
+    :return: (title, None) on early exit, (None, html) when the whole page was read without a header
+    """
+    async with semaphore:
+        print(Fore.YELLOW + f"Streaming HTML for episode {episode_number}", flush=True)
+
+        url = f'{BASE_URL}/{episode_number}'
+
+        async with session.get(url) as reply:
+            reply.raise_for_status()
+            decoder = codecs.getincrementaldecoder(reply.charset or 'utf-8')(errors='replace')
+            finder = HeaderFinder()
+            chunks = []
+
+            async for chunk in reply.content.iter_chunked(CHUNK_SIZE):
+                text = decoder.decode(chunk)
+                chunks.append(text)
+                finder.feed(text)
+                if finder.title is not None:
+                    # drop the rest of the body together with the connection
+                    reply.close()
+                    return finder.title, None
+
+            chunks.append(decoder.decode(b'', final=True))
+            return None, ''.join(chunks)
+
+
 def get_title(html: str, episode_number: int) -> str:
     print(Fore.CYAN + f"Getting TITLE for episode {episode_number}", flush=True)
     soup = bs4.BeautifulSoup(html, 'html.parser')
     header = soup.select_one('h1')
     if not header:
         return 'MISSING'
-    
+
     return header.text.strip()
 
 
-async def get_title_range(loop: AbstractEventLoop):
-    tasks = []
-    # using a small range to avoid DDoS   
-    for n in range(190, 200):
-        tasks.append((loop.create_task(get_html(n)), n))
+async def stream_titles(
+    loop: AbstractEventLoop,
+    episodes,
+    concurrency: int = MAX_CONCURRENCY,
+    parse_workers: int = PARSE_WORKERS,
+    queue_size: int = QUEUE_SIZE,
+    cache: PageCache = None,
+    stream: bool = False,
+):
+    """
+    Download pages into a bounded queue & parse them in a process pool
+    In stream mode the header is taken while downloading, only pages without one get parsed
+    Yield (episode_number, title, error) in order of completion
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    pages = asyncio.Queue(maxsize=queue_size)
+    titles = asyncio.Queue()
+    todo = iter(episodes)
+
+    async def download(session):
+        # every downloader pulls the next episode number until none is left
+        for n in todo:
+            try:
+                if stream:
+                    title, html = await get_title_streamed(session, n, semaphore)
+                    if title is not None:
+                        await titles.put((n, title, None))
+                        continue
+                else:
+                    html = await get_html(session, n, semaphore, cache)
+            except Exception as err:
+                # decoding & cache errors too, one bad episode must not stop its downloader
+                await titles.put((n, None, err))
+                continue
+            # blocks while the parsers are behind
+            await pages.put((n, html))
+
+    async def parse(pool):
+        while (page := await pages.get()) is not None:
+            n, html = page
+            try:
+                title = await loop.run_in_executor(pool, get_title, html, n)
+            except Exception as err:
+                await titles.put((n, None, err))
+            else:
+                await titles.put((n, title, None))
+        # tell the reader this parser is done
+        await titles.put(None)
+
+    async def produce(session, parsers):
+        try:
+            await asyncio.gather(*(download(session) for _ in range(concurrency)))
+        finally:
+            # the parsers stop on these, without them the reader would wait forever
+            for _ in parsers:
+                await pages.put(None)
+
+    with ProcessPoolExecutor(parse_workers) as pool:
+        async with new_session() as session:
+            parsers = [loop.create_task(parse(pool)) for _ in range(parse_workers)]
+            producer = loop.create_task(produce(session, parsers))
+            try:
+                running = len(parsers)
+                while running:
+                    result = await titles.get()
+                    if result is None:
+                        running -= 1
+                        continue
+                    yield result
+                await producer
+            finally:
+                for task in [producer, *parsers]:
+                    task.cancel()
+
+
+async def get_title_range(
+    loop: AbstractEventLoop,
+    episodes=range(190, 200),
+    concurrency: int = MAX_CONCURRENCY,
+    parse_workers: int = PARSE_WORKERS,
+    cache: PageCache = None,
+    stream: bool = False,
+):
+    # using a small range to avoid DDoS
+    titles = stream_titles(
+        loop, episodes, concurrency, parse_workers, cache=cache, stream=stream
+    )
+    async for n, title, error in titles:
+        if error is not None:
+            print(Fore.RED + f'Episode {n} failed: {error!r}', flush=True)
+        else:
+            print(Fore.WHITE + f'Title found: {title}', flush=True)
+
+
+
+def load_checkpoint(out_path: str) -> tuple[set, dict]:
+    """
+    Read back what previous runs wrote
+    :return: episodes already saved to out_path & the latest retry state of failed episodes
+    """
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path) as out:
+            for line in out:
+                # a run killed mid-write leaves a partial last line
+                try:
+                    done.add(json.loads(line)['episode'])
+                except (ValueError, KeyError):
+                    continue
+
+    failed = {}
+    if os.path.exists(out_path + '.state'):
+        with open(out_path + '.state') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                failed[entry['episode']] = entry
+    return done, failed
+
+
+async def crawl(
+    loop: AbstractEventLoop,
+    episodes,
+    out_path: str,
+    concurrency: int = MAX_CONCURRENCY,
+    parse_workers: int = PARSE_WORKERS,
+    cache: PageCache = None,
+    stream: bool = False,
+    max_attempts: int = MAX_ATTEMPTS,
+):
+    """
+    Resumable crawl
+    Every title is appended to out_path as soon as it is found, episodes already there are skipped
+    Failed episodes are journaled to out_path + '.state' with their attempts & next retry time,
+    then retried with exponential backoff until max_attempts is reached
+    """
+    done, failed = load_checkpoint(out_path)
+    pending = {
+        n for n in episodes
+        if n not in done and failed.get(n, {}).get('attempts', 0) < max_attempts
+    }
+    print(Fore.GREEN + f'{len(pending)} episodes to go, {len(done)} already saved', flush=True)
+
+    with open(out_path, 'a') as out, open(out_path + '.state', 'a') as journal:
+        while pending:
+            now = time.time()
+            ready = sorted(n for n in pending if failed.get(n, {}).get('retry_at', 0) <= now)
+            if not ready:
+                wake_up = min(failed[n]['retry_at'] for n in pending)
+                await asyncio.sleep(wake_up - now)
+                continue
+
+            titles = stream_titles(
+                loop, ready, concurrency, parse_workers, cache=cache, stream=stream
+            )
+            async for n, title, error in titles:
+                if error is None:
+                    out.write(json.dumps({'episode': n, 'title': title}) + '\n')
+                    out.flush()
+                    pending.discard(n)
+                    print(Fore.WHITE + f'Title found: {title}', flush=True)
+                    continue
+
+                attempts = failed.get(n, {}).get('attempts', 0) + 1
+                delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+                failed[n] = {
+                    'episode': n,
+                    'attempts': attempts,
+                    'retry_at': time.time() + delay,
+                    'error': repr(error),
+                }
+                journal.write(json.dumps(failed[n]) + '\n')
+                journal.flush()
+                if attempts >= max_attempts:
+                    pending.discard(n)
+                    print(Fore.RED + f'Episode {n} given up after {attempts} attempts: {error!r}', flush=True)
+                else:
+                    print(Fore.RED + f'Episode {n} failed, retry in {delay:.0f}s: {error!r}', flush=True)
 
-    for task in tasks:
-        html = await task
-        title = await get_title(html, n)
-        print(Fore.WHITE + f'Title found: {title}', flush=True)
-        
 
 if __name__ == '__main__':
     main()
@@ -2,80 +2,265 @@
 # lowercase in range(97, 122)
 
 
-def encrypt():
-    # if the encrypted letter's ASCII code is bigger than "z", reduce the offset value until "z" 
-    # and use the remainder as offset at the start of the alphabet, 
-    # otherwise add the offset to the character code
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from string import ascii_lowercase, ascii_uppercase
 
-    encrypted = ""
-    text = input("Enter the text to be encrypted\n")
-    key = input("Enter an encryption key between 1 - 25\n")
+# bytes read & translated at once when streaming files
+CHUNK_SIZE = 1024 * 1024
+# bytes looked at to recover a key, taken in evenly spaced blocks across big files
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 16
+# bytes of a file handled by one worker process in batch mode
+PART_SIZE = 64 * 1024 * 1024
 
-    # ask user for encryption key to offset letters
-    while not key.isnumeric() and key not in range(1, 26):
-        key = input("Enter an encryption key between 1 - 25\n")
-    key = int(key)
+LETTERS = ascii_uppercase + ascii_lowercase
 
-    # encrypt only characters
-    for ch in text:
-        if not ch.isalpha():
-            encrypted += ch
+# relative frequency of "a" to "z" in English text, in %
+ENGLISH_FREQ = [
+    8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966,
+    0.153, 0.772, 4.025, 2.406, 6.749, 7.507, 1.929, 0.095, 5.987,
+    6.327, 9.056, 2.758, 0.978, 2.360, 0.150, 1.974, 0.074,
+]
 
-        # translate upper case character to ASCII code
-        elif ch.isalpha() and ch.isupper():
-            if ord(ch) + key > 90:
-                offset = key - (90 - ord(ch))
-                encrypted += chr(65 + offset - 1)
-            else:
-                encrypted += chr(ord(ch) + key)
 
-        # translate lower case character to ASCII code
-        elif ch.isalpha() and ch.islower():
-            if ord(ch) + key > 122:
-                offset = key - (122 - ord(ch))
-                encrypted += chr(97 + offset - 1)
-            else:
-                encrypted += chr(ord(ch) + key)
+def shifted_letters(key: int) -> str:
+    """
+    Both alphabets moved key positions, letters past "z" wrap around to the start
+    A negative key shifts backwards
+    """
+    key %= 26
+    return ascii_uppercase[key:] + ascii_uppercase[:key] + ascii_lowercase[key:] + ascii_lowercase[:key]
 
-    print(encrypted)
 
+@lru_cache(maxsize=None)
+def shift_table(key: int) -> dict:
+    """
+    str.translate table of a key, built once per key
+    """
+    return str.maketrans(LETTERS, shifted_letters(key))
 
-def decrypt():
-    # if the derypted letter's ASCII code is lower than "a", reduce the offset value until "a" 
-    # and use the remainder as offset from the end of the alphabet towards the start, 
-    # otherwise decrease the offset of the encrypted character code
 
-    decrypted = ""
+@lru_cache(maxsize=None)
+def shift_bytes_table(key: int) -> bytes:
+    """
+    bytes.translate table of a key
+    Only ASCII letters change, so UTF-8 multi-byte characters pass through untouched
+    """
+    return bytes.maketrans(LETTERS.encode(), shifted_letters(key).encode())
+
+
+def shift(text: str, key: int) -> str:
+    """
+    Encrypt text with a positive key, decrypt with the negative one
+    """
+    return text.translate(shift_table(key))
+
+
+def shift_stream(src, dst, key: int, chunk_size: int = CHUNK_SIZE):
+    """
+    Shift a binary stream into another chunk by chunk, memory use does not grow with the input
+    """
+    table = shift_bytes_table(key)
+    while chunk := src.read(chunk_size):
+        dst.write(chunk.translate(table))
+
+
+def shift_part(src_path: str, dst_path: str, key: int, start: int, length: int):
+    """
+    Shift length bytes of src_path starting at start into the same offset of dst_path
+    The cipher keeps the length, so every part of the output can be written independently
+    """
+    table = shift_bytes_table(key)
+    with open(src_path, 'rb') as src, open(dst_path, 'r+b') as dst:
+        src.seek(start)
+        dst.seek(start)
+        while length > 0:
+            chunk = src.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            dst.write(chunk.translate(table))
+            length -= len(chunk)
+
+
+def plan_parts(src: str, dst: str, part_size: int = PART_SIZE) -> list[tuple]:
+    """
+    Split a file, or every file of a directory tree, into (src, dst, start, length) parts
+    Output files are created at their final size & directories mirrored on the way
+    """
+    if os.path.isdir(src):
+        pairs = []
+        for root, _, files in os.walk(src):
+            target = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target, exist_ok=True)
+            pairs += [(os.path.join(root, f), os.path.join(target, f)) for f in files]
+    else:
+        pairs = [(src, dst)]
+
+    parts = []
+    for src_path, dst_path in pairs:
+        size = os.path.getsize(src_path)
+        with open(dst_path, 'ab') as out:
+            out.truncate(size)
+        parts += [
+            (src_path, dst_path, start, min(part_size, size - start))
+            for start in range(0, size, part_size)
+        ]
+    return parts
+
+
+def shift_batch(src: str, dst: str, key: int, workers: int = None, part_size: int = PART_SIZE) -> int:
+    """
+    Encrypt (positive key) or decrypt (negative key) a file or directory tree into dst
+    across a pool of processes
+    :return: number of parts processed
+    """
+    parts = plan_parts(src, dst, part_size)
+    if not parts:
+        return 0
+
+    src_paths, dst_paths, starts, lengths = zip(*parts)
+    with ProcessPoolExecutor(workers) as pool:
+        # consume the results so a failing part raises here
+        for _ in pool.map(shift_part, src_paths, dst_paths, [key] * len(parts), starts, lengths):
+            pass
+    return len(parts)
+
+
+def letter_histogram(data: bytes):
+    """
+    Count of each letter "a" to "z" in data, upper & lower case together
+    """
+    import numpy as np
+
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return counts[65:91] + counts[97:123]
+
+
+def key_scores(histogram):
+    """
+    Chi-squared distance from English of the text decrypted with every key 0 - 25
+    Decrypting with key k turns letter (i + k) % 26 into letter i,
+    so each key is a rotation of the one histogram instead of another pass over the text
+    ValueError when the histogram is empty, no key scores better than another then
+    """
+    import numpy as np
+
+    if not histogram.sum():
+        raise ValueError('no letters in the sample, the key cannot be recovered')
+    expected = np.asarray(ENGLISH_FREQ) / 100 * histogram.sum()
+    rotations = (np.arange(26)[:, None] + np.arange(26)[None, :]) % 26
+    return (((histogram[rotations] - expected) ** 2) / expected).sum(axis=1)
+
+
+def crack(data: bytes) -> int:
+    """
+    Most likely key of an English ciphertext, 0 if it does not look shifted at all
+    ValueError if data has no letters (empty or binary)
+    Decrypt with shift(text, -key)
+    """
+    return int(key_scores(letter_histogram(data)).argmin())
+
+
+def sample_file(src, sample_size: int = SAMPLE_SIZE, blocks: int = SAMPLE_BLOCKS) -> bytes:
+    """
+    Read sample_size bytes in evenly spaced blocks of a seekable binary file,
+    or just the start of it when it is small or cannot seek (pipes)
+    """
+    try:
+        size = os.fstat(src.fileno()).st_size
+        seekable = src.seekable()
+    except (OSError, ValueError):
+        size, seekable = 0, False
+    if not seekable or size <= sample_size:
+        return src.read(sample_size)
+
+    block = sample_size // blocks
+    stride = size // blocks
+    sample = []
+    for z in range(blocks):
+        src.seek(z * stride)
+        sample.append(src.read(block))
+    return b''.join(sample)
+
+
+def ask_key(mzg: str) -> int:
+    # ask user for the key to offset letters
+    key = input(mzg)
+    while not (key.isnumeric() and int(key) in range(1, 26)):
+        key = input(mzg)
+    return int(key)
+
+
+def encrypt():
+    # every letter moves key positions forward, wrapping from "z" back to "a"
+    text = input("Enter the text to be encrypted\n")
+    key = ask_key("Enter an encryption key between 1 - 25\n")
+    print(shift(text, key))
+
+
+def decrypt():
+    # every letter moves key positions backward, wrapping from "a" back to "z"
     text = input("Enter the text to be decrypted\n")
-    key = input("Enter the decryption key between 1 - 25\n")
+    key = ask_key("Enter the decryption key between 1 - 25\n")
+    print(shift(text, -key))
 
-    # ask user for decryption key to offset letters
-    while not key.isnumeric() and key not in range(1, 26):
-        key = input("Enter an decryption key between 1 - 25\n")
-    key = int(key)
 
-    # decrypt only characters
-    for ch in text:
-        if not ch.isalpha():
-            decrypted += ch
+def run_cli(argv: list[str]):
+    """
+    Non-interactive mode: stream files or stdin to stdout, crack keys or batch process on all cores
+    """
+    parser = argparse.ArgumentParser(description='Caesar cipher for large files')
+    modes = parser.add_subparsers(dest='mode', required=True)
+    for mode in ['encrypt', 'decrypt']:
+        cipher = modes.add_parser(mode)
+        cipher.add_argument('key', type=int, choices=range(1, 26), metavar='key (1-25)')
+        cipher.add_argument('files', nargs='*', help='read stdin when no file is given')
+    cracker = modes.add_parser('crack', help='print the recovered key of each file')
+    cracker.add_argument('files', nargs='*', help='read stdin when no file is given')
+    batch = modes.add_parser('batch', help='shift a big file or a directory tree on all cores')
+    batch.add_argument('action', choices=['encrypt', 'decrypt'])
+    batch.add_argument('key', type=int, choices=range(1, 26), metavar='key (1-25)')
+    batch.add_argument('src', help='file or directory')
+    batch.add_argument('dst', help='output file or directory')
+    batch.add_argument('--workers', type=int, help='processes, defaults to the number of cores')
+    batch.add_argument('--part-size', type=int, default=PART_SIZE, help='bytes per task')
+    args = parser.parse_args(argv)
 
-        # translate upper case character to ASCII code
-        elif ch.isalpha() and ch.isupper():
-            if ord(ch) - key < 65:
-                offset = key - (ord(ch) - 65)
-                decrypted += chr(90 - offset + 1)
-            else:
-                decrypted += chr(ord(ch) - key)
+    if args.mode == 'batch':
+        key = args.key if args.action == 'encrypt' else -args.key
+        parts = shift_batch(args.src, args.dst, key, args.workers, args.part_size)
+        print(f'{parts} parts written to {args.dst}', file=sys.stderr)
+        return
 
-        # translate lower case character to ASCII code
-        elif ch.isalpha() and ch.islower():
-            if ord(ch) - key < 97:
-                offset = key - (ord(ch) - 97)
-                decrypted += chr(122 - offset + 1)
-            else:
-                decrypted += chr(ord(ch) - key)
+    if args.mode == 'crack':
+        failed = 0
+        for path in args.files or ['-']:
+            label = '' if not args.files else f'{path}: '
+            try:
+                if not args.files:
+                    key = crack(sample_file(sys.stdin.buffer))
+                else:
+                    with open(path, 'rb') as src:
+                        key = crack(sample_file(src))
+            except ValueError as err:
+                print(f'{label}{err}', file=sys.stderr)
+                failed = 1
+                continue
+            print(f'{label}{key}')
+        return failed
 
-    print(decrypted)
+    key = args.key if args.mode == 'encrypt' else -args.key
+    out = sys.stdout.buffer
+    if not args.files:
+        shift_stream(sys.stdin.buffer, out, key)
+    for path in args.files:
+        with open(path, 'rb') as src:
+            shift_stream(src, out, key)
+    out.flush()
 
 
 def show_menu():
@@ -95,12 +280,16 @@ def show_menu():
 
     except ValueError:
         print("You must choose correctly, Neo!\nErgo, try again\n")
-        showMenu()
+        show_menu()
 
 
 # Start Game:
 
-print("Wake up, Neo\nWhich pill will you take?")
-while True:
-    show_menu()
-    print("\nWhat now?")
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        raise SystemExit(run_cli(sys.argv[1:]))
+
+    print("Wake up, Neo\nWhich pill will you take?")
+    while True:
+        show_menu()
+        print("\nWhat now?")
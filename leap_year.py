@@ -1,29 +1,363 @@
+import argparse
+import csv
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, islice
+from os import cpu_count
+from time import perf_counter
+
+# reason codes of the batch validators
+OK, MALFORMED, BAD_YEAR, BAD_MONTH, BAD_DAY = range(5)
+REASONS = {
+    OK: "ok",
+    MALFORMED: "malformed",
+    BAD_YEAR: "year is not 4 digits long",
+    BAD_MONTH: "month out of range",
+    BAD_DAY: "day out of range",
+}
+# rows sent to a worker process at once & rows used to pick the format of a column
+CHUNK_SIZE = 50_000
+SAMPLE_SIZE = 1_000
+
+# days per month of a common year, index 0 unused
+MONTH_DAYS = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# the Gregorian calendar repeats every 400 years, counted here from year 1
+CYCLE_YEARS = 400
+CYCLE_DAYS = 146097
+# leap flag & days from the start of the cycle to January 1st of each year of the cycle
+CYCLE_LEAP = [
+    (y + 1) % 400 == 0 or ((y + 1) % 100 != 0 and (y + 1) % 4 == 0) for y in range(CYCLE_YEARS)
+]
+CYCLE_YEAR_START = list(accumulate((365 + leap for leap in CYCLE_LEAP[:-1]), initial=0))
+# month lengths & days before the 1st of each month, indexed by [leap][month]
+MONTH_LENGTHS = (MONTH_DAYS, MONTH_DAYS[:2] + [29] + MONTH_DAYS[3:])
+MONTH_START = tuple([0] + [sum(lengths[1:m]) for m in range(1, 13)] for lengths in MONTH_LENGTHS)
+
+# formats told apart once per column: pattern & order of the captured day, month, year
+# ASCII digits only, \d alone matches any Unicode digit
+DATE_FORMATS = {
+    "dmy_dot": (re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})", re.ASCII), (0, 1, 2)),
+    "dmy_slash": (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})", re.ASCII), (0, 1, 2)),
+    "iso": (re.compile(r"(\d{4})-(\d{2})-(\d{2})", re.ASCII), (2, 1, 0)),
+}
+
+
+def is_year_leap(year):
+    return CYCLE_LEAP[(year - 1) % CYCLE_YEARS]
+
+
+def days_in_month(year, month):
+    return MONTH_LENGTHS[is_year_leap(year)][month]
+
+
+def check_date(day, month, year):
+    """
+    Reason code of a day, month & year triple, OK when it is a real date
+    """
+    if not 0 <= year <= 9999:
+        return BAD_YEAR
+    if not 1 <= month <= 12:
+        return BAD_MONTH
+    if not 1 <= day <= days_in_month(year, month):
+        return BAD_DAY
+    return OK
+
+
+def ordinal(year, month, day):
+    """
+    Days since 0001-01-01, which is day 1, as date.toordinal() counts them
+    """
+    cycles, y = divmod(year - 1, CYCLE_YEARS)
+    return (
+        cycles * CYCLE_DAYS + CYCLE_YEAR_START[y] + MONTH_START[CYCLE_LEAP[y]][month] + day
+    )
+
+
+def day_of_year(year, month, day):
+    return MONTH_START[is_year_leap(year)][month] + day
+
+
+def day_of_week(year, month, day):
+    """
+    0 for Monday through 6 for Sunday, like date.weekday()
+    """
+    return (ordinal(year, month, day) - 1) % 7
+
+
 def valid_date(dt, sep="."):
+    parts = dt.split(sep)
+    # isdigit would let "²" through to int()
+    if len(parts) != 3 or not all(part.isascii() and part.isdecimal() for part in parts):
+        return False
+    dd, mm, yyyy = parts
+    if len(yyyy) != 4 or any(len(part.lstrip("0")) > 4 for part in (dd, mm)):
+        return False
+    return check_date(int(dd), int(mm), int(yyyy)) == OK
 
-    def is_year_leap(year):
-        if year % 400 == 0 and (
-            year % 100 != 0 and year % 4 == 0
-        ):
-            return True
-        else:
-            return False
 
-    def days_in_month(year, month):
-        month_num = { 
-            31: [1,3,5,7,8,10,12],
-            30: [2,4,6,9,11]
+class DateValidator:
+    """
+    Validate a column of dates in one of DATE_FORMATS
+    The format is chosen once, by name or from a sample of the column, then every value
+    costs one compiled match & a few table lookups
+    """
+    def __init__(self, fmt="dmy_dot"):
+        self.fmt = fmt
+        self.pattern, self.order = DATE_FORMATS[fmt]
+
+    @classmethod
+    def for_column(cls, sample):
+        """
+        Validator of the format most values of the sample match
+        """
+        sample = list(sample)
+        hits = {
+            fmt: sum(1 for value in sample if pattern.fullmatch(value))
+            for fmt, (pattern, _) in DATE_FORMATS.items()
         }
-        if month == 2:
-            if is_year_leap(year):
-                return 29
-            return 28
-        for days, months in month_num.items():
-            if month in months:
-                return days
-
-    dd, mm, yyyy = dt.split(sep)
-    mm = int(mm.lstrip("0"))
-    dd = int(dd.lstrip("0"))
-    if dd <= days_in_month(mm) and len(yyyy) == 4:
-        return True
-    return False
+        return cls(max(hits, key=hits.get))
+
+    def parse(self, value):
+        """
+        :return: (day, month, year) or None when the value does not match the format
+        """
+        match = self.pattern.fullmatch(value)
+        if match is None:
+            return None
+        fields = match.groups()
+        d, m, y = self.order
+        return int(fields[d]), int(fields[m]), int(fields[y])
+
+    def check(self, value):
+        """
+        Reason code of one value, see REASONS
+        """
+        parts = self.parse(value)
+        if parts is None:
+            return MALFORMED
+        return check_date(*parts)
+
+    def validate(self, value):
+        return self.check(value) == OK
+
+    def validate_column(self, values):
+        return [self.check(value) == OK for value in values]
+
+
+def valid_date_parts(day, month, year):
+    """
+    Vectorized validation of day, month & year arrays
+    :return: boolean mask & reason codes, both NumPy arrays
+    """
+    import numpy as np
+
+    day, month, year = (np.asarray(x, dtype=np.int64) for x in (day, month, year))
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_ok = (month >= 1) & (month <= 12)
+    # month 0 reads the unused slot of the table for months out of range
+    length = np.asarray(MONTH_DAYS)[np.where(month_ok, month, 0)] + (leap & (month == 2))
+    reasons = np.select(
+        [(year < 0) | (year > 9999), ~month_ok, (day < 1) | (day > length)],
+        [BAD_YEAR, BAD_MONTH, BAD_DAY],
+        OK,
+    ).astype(np.int8)
+    return reasons == OK, reasons
+
+
+def valid_dates(dates, sep="."):
+    """
+    Vectorized valid_date over a NumPy array, pandas Series or list of "DD<sep>MM<sep>YYYY" strings
+    Zero padded dates are parsed with array arithmetic, other rows go through str.split
+    :return: boolean mask & reason codes (see REASONS), both NumPy arrays
+    """
+    import numpy as np
+
+    values = np.asarray(dates, dtype=str)
+    day = np.zeros(len(values), dtype=np.int64)
+    month = np.zeros(len(values), dtype=np.int64)
+    year = np.zeros(len(values), dtype=np.int64)
+    malformed = np.zeros(len(values), dtype=bool)
+    short_year = np.zeros(len(values), dtype=bool)
+
+    fixed = np.char.str_len(values) == 10 if len(sep) == 1 else np.zeros(len(values), dtype=bool)
+    if fixed.any():
+        # code points of every character, one row per date
+        rows = np.flatnonzero(fixed)
+        chars = values[rows].astype("U10").view(np.uint32).reshape(-1, 10).astype(np.int64)
+        # 10 characters with the separators elsewhere, like "1.12.20000", go through str.split
+        # so the reason does not depend on the length
+        aligned = (chars[:, 2] == ord(sep)) & (chars[:, 5] == ord(sep))
+        fixed[rows[~aligned]] = False
+        chars = chars[aligned]
+        digits = chars - ord("0")
+        digit_cols = [0, 1, 3, 4, 6, 7, 8, 9]
+        malformed[fixed] = ~((digits[:, digit_cols] >= 0) & (digits[:, digit_cols] <= 9)).all(axis=1)
+        day[fixed] = digits[:, 0] * 10 + digits[:, 1]
+        month[fixed] = digits[:, 3] * 10 + digits[:, 4]
+        year[fixed] = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+
+    for ndx in np.flatnonzero(~fixed):
+        parts = values[ndx].split(sep)
+        # isdigit would let "²" through to int()
+        if len(parts) != 3 or not all(part.isascii() and part.isdecimal() for part in parts):
+            malformed[ndx] = True
+            continue
+        dd, mm, yyyy = parts
+        if len(yyyy) != 4:
+            short_year[ndx] = True
+            continue
+        # a day or month of more than 4 significant digits is out of range anyway & might not fit int64
+        day[ndx], month[ndx] = (int(part) if len(part.lstrip("0")) <= 4 else 10_000 for part in (dd, mm))
+        year[ndx] = int(yyyy)
+
+    _, reasons = valid_date_parts(day, month, year)
+    reasons[short_year] = BAD_YEAR
+    reasons[malformed] = MALFORMED
+    return reasons == OK, reasons
+
+
+def check_rows(chunk, formats):
+    """
+    Worker side of validate_file
+    :param chunk: (line number, values of the chosen columns, None where the row is too short)
+    :return: (line number, column position, value, reason code) of every invalid date of the chunk
+    """
+    validators = [DateValidator(fmt) for fmt in formats]
+    rejects = []
+    for line_no, values in chunk:
+        for pos, (value, validator) in enumerate(zip(values, validators)):
+            if value is None:
+                rejects.append((line_no, pos, "", MALFORMED))
+                continue
+            reason = validator.check(value)
+            if reason != OK:
+                rejects.append((line_no, pos, value, reason))
+    return rejects
+
+
+def resolve_columns(names, columns):
+    """
+    :param names: header fields, empty without a header
+    :return: 0-based indexes of columns given by name or index, ValueError for an unknown one
+    """
+    indexes = []
+    for col in columns:
+        if col in names:
+            indexes.append(names.index(col))
+        elif str(col).isdigit():
+            indexes.append(int(col))
+        elif names:
+            raise ValueError(f"unknown column {col!r}, the header has {', '.join(names)}")
+        else:
+            raise ValueError(f"column {col!r} is not an index, without a header columns are 0-based indexes")
+    return indexes
+
+
+def validate_file(
+    source,
+    columns,
+    rejects,
+    fmt=None,
+    delimiter=",",
+    header=True,
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    Stream a CSV or delimited log file & validate its date columns in chunks across worker processes
+    Only the chosen columns are sent to the workers & at most two chunks per worker are in flight,
+    so memory use does not grow with the file
+    :param source: open text file
+    :param columns: column names (needs a header) or 0-based indexes, ValueError for an unknown one
+    :param rejects: csv.writer receiving line, column, value & reason of every invalid date
+    :param fmt: one of DATE_FORMATS for all columns, picked per column from the first rows when None
+    :return: rows read & invalid dates found
+    """
+    reader = csv.reader(source, delimiter=delimiter, skipinitialspace=delimiter == " ")
+    names = next(reader, []) if header else []
+    columns = resolve_columns(names, columns)
+    labels = [names[col] if col < len(names) else str(col) for col in columns]
+    rows = (
+        (reader.line_num, [row[col] if col < len(row) else None for col in columns])
+        for row in reader
+    )
+
+    first = list(islice(rows, chunk_size))
+    if fmt is None:
+        formats = [
+            DateValidator.for_column(
+                values[pos] for _, values in first[:SAMPLE_SIZE] if values[pos] is not None
+            ).fmt
+            for pos in range(len(columns))
+        ]
+    else:
+        formats = [fmt] * len(columns)
+
+    workers = workers or cpu_count() or 1
+    total = rejected = 0
+
+    def write(job):
+        found = job.result()
+        rejects.writerows(
+            [line_no, labels[pos], value, REASONS[reason]]
+            for line_no, pos, value, reason in found
+        )
+        return len(found)
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        chunk = first
+        while chunk:
+            total += len(chunk)
+            pending.append(pool.submit(check_rows, chunk, formats))
+            if len(pending) >= 2 * workers:
+                rejected += write(pending.popleft())
+            chunk = list(islice(rows, chunk_size))
+        while pending:
+            rejected += write(pending.popleft())
+    return total, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the date columns of a CSV or log file")
+    parser.add_argument("file", help="- reads stdin")
+    parser.add_argument("columns", nargs="+", help="column names or 0-based indexes")
+    parser.add_argument("--rejects", default="rejects.csv", help="invalid dates go here (default: rejects.csv)")
+    parser.add_argument("--format", choices=list(DATE_FORMATS), help="skip format detection")
+    parser.add_argument("--delimiter", default=",", help='field separator, " " for logs')
+    parser.add_argument("--no-header", action="store_true", help="first line is data")
+    parser.add_argument("--workers", type=int, help="processes, defaults to the number of cores")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per task")
+    args = parser.parse_args()
+
+    if args.no_header and not all(col.isdigit() for col in args.columns):
+        parser.error("without a header columns are 0-based indexes")
+
+    start = perf_counter()
+    source = sys.stdin if args.file == "-" else open(args.file, newline="")
+    with source, open(args.rejects, "w", newline="") as out:
+        rejects = csv.writer(out)
+        rejects.writerow(["line", "column", "value", "reason"])
+        try:
+            total, rejected = validate_file(
+                source,
+                args.columns,
+                rejects,
+                fmt=args.format,
+                delimiter=args.delimiter,
+                header=not args.no_header,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+            )
+        except ValueError as err:
+            parser.error(str(err))
+    elapsed = perf_counter() - start
+    print(
+        f"{total} rows, {rejected} invalid dates written to {args.rejects} "
+        f"in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s)",
+        file=sys.stderr,
+    )
+    sys.exit(1 if rejected else 0)
@@ -1,19 +1,52 @@
+import argparse
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from os import cpu_count
+from time import perf_counter
+
+# all nine digits of a row, column or box as bits 0 - 8
+FULL_MASK = 0b111111111
+# bit of each accepted cell character
+DIGIT_BITS = {str(d): 1 << (d - 1) for d in range(1, 10)}
+# inner matrix (box) number of every cell
+BOX_OF = [[(z // 3) * 3 + q // 3 for q in range(9)] for z in range(9)]
+# boards validated at once by validate_many
+BATCH_SIZE = 100_000
+# boards sent to a worker process at once by the command line validator
+CHUNK_SIZE = 10_000
+# flat cell index 0 - 80 -> row, column, box & cell bit -> digit
+ROW_AT = [i // 9 for i in range(81)]
+COLUMN_AT = [i % 9 for i in range(81)]
+BOX_AT = [BOX_OF[i // 9][i % 9] for i in range(81)]
+BIT_DIGITS = {bit: digit for digit, bit in DIGIT_BITS.items()}
+
+
 class SudokuValidator:
     """
     Validate a Sudoku board
     Create new object using a list of 9-digit long strings
-    """   
+    Rows, columns & inner matrixes are kept as 9-bit digit masks built in one pass
+    """
     def __init__(self, matrix_input: list[str]):
         self.matrix = {}
         # outer matrix rows
         self.row = matrix_input
-        # initialize outer matrix columns
-        self.column = [["0" for _ in range(9)] for _ in range(9)]
-        # assign outer matrix column values
-        for q in range(9):
-            for x in range(9):
-                self.column[q][x] = self.row[x][q]
-       
+        self.row_mask = [0] * 9
+        self.column_mask = [0] * 9
+        self.box_mask = [0] * 9
+        # any cell other than 1 - 9 fails the board
+        self.bad_cell = False
+        for z in range(9):
+            for q in range(9):
+                bit = DIGIT_BITS.get(self.row[z][q], 0)
+                if not bit:
+                    self.bad_cell = True
+                self.row_mask[z] |= bit
+                self.column_mask[q] |= bit
+                self.box_mask[BOX_OF[z][q]] |= bit
+
     def build_matrix_dict(self) -> dict:
         """
         Build dictionary of the 9 inner matrix based on user input
@@ -65,23 +98,19 @@ class SudokuValidator:
         print("+-----+-----+-----+-----+-----+-----+-----+-----+-----+"),
 
     def validate_inner_matrix(self) -> bool:
-        for value in self.matrix.values():
-            for z in range(9):
-                if value.count(str(z + 1)) != 1:
-                    return False
-                else:
-                    return True
-    
+        return not self.bad_cell and all(mask == FULL_MASK for mask in self.box_mask)
+
     def validate_outer_matrix(self) -> bool:
-        for z in range(9):
-            if (
-                self.row[z].count(str(z + 1)) == 1
-                and self.column[z].count(str(z + 1)) == 1
-            ):
-                continue
-            else:
-                return False
-        return True
+        return not self.bad_cell and all(
+            row == FULL_MASK and column == FULL_MASK
+            for row, column in zip(self.row_mask, self.column_mask)
+        )
+
+    def is_valid(self) -> bool:
+        """
+        Validation without drawing or printing anything
+        """
+        return self.validate_inner_matrix() and self.validate_outer_matrix()
 
     def validation(self) -> bool:
         """
@@ -89,10 +118,8 @@ class SudokuValidator:
         :return: bool
         """
         self.draw_board()
-        inner_matrix = self.validate_inner_matrix()
-        outer_matrix = self.validate_outer_matrix()
 
-        if inner_matrix and outer_matrix:
+        if self.is_valid():
             print("Valid Sudoku board\n\n")
             return True
         else:
@@ -100,32 +127,371 @@ class SudokuValidator:
             return False
 
 
-# test case variables
-valid = [
-    "295743861",
-    "431865927",
-    "876192543",
-    "387459216",
-    "612387495",
-    "549216738",
-    "763524189",
-    "928671354",
-    "154938672",
-]
-
-invalid = [
-    "195743862",
-    "431865927",
-    "876192543",
-    "387459216",
-    "612387495",
-    "549216738",
-    "763524189",
-    "928671354",
-    "254938671",
-]
-
-board1 = SudokuValidator(valid)
-board1.validation()
-board2 = SudokuValidator(invalid)
-board2.validation()
+class SudokuBoard:
+    """
+    Mutable Sudoku board for interactive & search use
+    Keeps per row, column & inner matrix digit counters,
+    so every edit & validity check costs the same whatever the board looks like
+    Cells are addressed by row & column 0 - 8, digit 0 is an empty cell
+    """
+    def __init__(self, matrix_input: list[str] = None):
+        self.cells = [[0] * 9 for _ in range(9)]
+        # counters indexed by unit then digit, index 0 unused
+        self.row_count = [[0] * 10 for _ in range(9)]
+        self.column_count = [[0] * 10 for _ in range(9)]
+        self.box_count = [[0] * 10 for _ in range(9)]
+        # digits beyond the first of their kind in any row, column or box
+        self.duplicates = 0
+        self.filled = 0
+        if matrix_input is not None:
+            for z in range(9):
+                for q in range(9):
+                    digit = matrix_input[z][q]
+                    if digit in DIGIT_BITS:
+                        self.set(z, q, int(digit))
+
+    def _counters(self, z: int, q: int) -> tuple[list, list, list]:
+        return self.row_count[z], self.column_count[q], self.box_count[BOX_OF[z][q]]
+
+    def set(self, z: int, q: int, digit: int) -> bool:
+        """
+        Write a digit 1 - 9, or clear the cell with 0, ValueError for anything else
+        :return: False if the digit now clashes with its row, column or box
+        """
+        if not 0 <= digit <= 9:
+            raise ValueError(f'{digit} is not a digit 0 - 9')
+        self.clear(z, q)
+        if not digit:
+            return True
+        for count in self._counters(z, q):
+            if count[digit]:
+                self.duplicates += 1
+            count[digit] += 1
+        self.cells[z][q] = digit
+        self.filled += 1
+        return not self.conflicts(z, q)
+
+    def clear(self, z: int, q: int):
+        digit = self.cells[z][q]
+        if not digit:
+            return
+        for count in self._counters(z, q):
+            count[digit] -= 1
+            if count[digit]:
+                self.duplicates -= 1
+        self.cells[z][q] = 0
+        self.filled -= 1
+
+    def can_place(self, z: int, q: int, digit: int) -> bool:
+        """
+        Would the digit fit the cell without clashing, leaving the board untouched
+        """
+        own = self.cells[z][q] == digit
+        return all(count[digit] - own == 0 for count in self._counters(z, q))
+
+    def conflicts(self, z: int, q: int) -> bool:
+        """
+        Does the digit of this cell appear again in its row, column or box
+        """
+        digit = self.cells[z][q]
+        return bool(digit) and any(count[digit] > 1 for count in self._counters(z, q))
+
+    def is_valid(self) -> bool:
+        """
+        No clashes so far, empty cells allowed
+        """
+        return not self.duplicates
+
+    def is_solved(self) -> bool:
+        return self.filled == 81 and not self.duplicates
+
+    def rows(self) -> list[str]:
+        """
+        Board as a list of 9-digit long strings, the format SudokuValidator takes
+        """
+        return [''.join(str(digit) for digit in row) for row in self.cells]
+
+
+def boards_to_array(boards):
+    """
+    Stack boards given as lists of 9 strings or 81-character strings into a (N, 9, 9) digit array
+    A board that is not 81 ASCII characters becomes all zeros, so it stays in place & never validates
+    """
+    import numpy as np
+
+    cells = []
+    for board in boards:
+        board = board if isinstance(board, str) else ''.join(board)
+        cells.append(board if len(board) == 81 and board.isascii() else '0' * 81)
+    text = ''.join(cells)
+    digits = np.frombuffer(text.encode(), dtype=np.uint8).astype(np.int16) - ord('0')
+    return digits.reshape(-1, 9, 9)
+
+
+def validate_many(boards, batch_size: int = BATCH_SIZE):
+    """
+    Validate many boards in vectorized passes of batch_size boards
+    :param boards: (N, 9, 9) or (N, 81) integer array, or a sequence of boards as accepted by boards_to_array
+    :return: (N,) boolean array
+    """
+    import numpy as np
+
+    if not isinstance(boards, np.ndarray):
+        boards = boards_to_array(boards)
+    boards = boards.reshape(-1, 9, 9)
+
+    valid = np.empty(len(boards), dtype=bool)
+    for start in range(0, len(boards), batch_size):
+        digits = boards[start:start + batch_size].astype(np.int16)
+        in_range = (digits >= 1) & (digits <= 9)
+        bits = np.where(in_range, np.left_shift(1, np.clip(digits - 1, 0, 8)), 0)
+        # (N, 3, 3, 3, 3) band, row in band, stack, column in stack -> one box per row
+        boxes = bits.reshape(-1, 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(-1, 9, 9)
+        valid[start:start + batch_size] = (
+            in_range.all(axis=(1, 2))
+            & (np.bitwise_or.reduce(bits, axis=2) == FULL_MASK).all(axis=1)
+            & (np.bitwise_or.reduce(bits, axis=1) == FULL_MASK).all(axis=1)
+            & (np.bitwise_or.reduce(boxes, axis=2) == FULL_MASK).all(axis=1)
+        )
+    return valid
+
+
+class SudokuSolver:
+    """
+    Fill a partial Sudoku board
+    Create new object using a list of 9-digit long strings or one 81-character string,
+    any character other than 1 - 9 is an empty cell
+    Same row, column & inner matrix masks as SudokuValidator, searched by bitmask backtracking
+    on the empty cell with the fewest candidates, so forced cells are filled first
+    """
+    def __init__(self, matrix_input):
+        if isinstance(matrix_input, str):
+            matrix_input = [matrix_input[z * 9:z * 9 + 9] for z in range(9)]
+        self.cells = [0] * 81
+        self.row_mask = [0] * 9
+        self.column_mask = [0] * 9
+        self.box_mask = [0] * 9
+        self.empty = []
+        # a given digit repeated in its row, column or box
+        self.conflict = False
+        self.solution = None
+        for i in range(81):
+            bit = DIGIT_BITS.get(matrix_input[ROW_AT[i]][COLUMN_AT[i]], 0)
+            if not bit:
+                self.empty.append(i)
+                continue
+            z, q, b = ROW_AT[i], COLUMN_AT[i], BOX_AT[i]
+            if (self.row_mask[z] | self.column_mask[q] | self.box_mask[b]) & bit:
+                self.conflict = True
+            self.row_mask[z] |= bit
+            self.column_mask[q] |= bit
+            self.box_mask[b] |= bit
+            self.cells[i] = bit
+
+    def _search(self, limit: int) -> int:
+        """
+        Count solutions up to limit, keep the first one found
+        """
+        if not self.empty:
+            if self.solution is None:
+                self.solution = [
+                    ''.join(BIT_DIGITS[bit] for bit in self.cells[z * 9:z * 9 + 9]) for z in range(9)
+                ]
+            return 1
+
+        # most constrained empty cell
+        best, best_candidates, best_count = 0, 0, 10
+        for pos, i in enumerate(self.empty):
+            candidates = FULL_MASK & ~(
+                self.row_mask[ROW_AT[i]] | self.column_mask[COLUMN_AT[i]] | self.box_mask[BOX_AT[i]]
+            )
+            count = candidates.bit_count()
+            if count < best_count:
+                best, best_candidates, best_count = pos, candidates, count
+                if count <= 1:
+                    break
+        if not best_count:
+            return 0
+
+        i = self.empty[best]
+        self.empty[best] = self.empty[-1]
+        self.empty.pop()
+        z, q, b = ROW_AT[i], COLUMN_AT[i], BOX_AT[i]
+
+        found = 0
+        while best_candidates and found < limit:
+            # lowest candidate digit
+            bit = best_candidates & -best_candidates
+            best_candidates ^= bit
+            self.cells[i] = bit
+            self.row_mask[z] |= bit
+            self.column_mask[q] |= bit
+            self.box_mask[b] |= bit
+            found += self._search(limit - found)
+            self.row_mask[z] ^= bit
+            self.column_mask[q] ^= bit
+            self.box_mask[b] ^= bit
+
+        self.cells[i] = 0
+        self.empty.append(i)
+        return found
+
+    def solve(self) -> list[str] | None:
+        """
+        :return: the first solution as a list of 9-digit long strings, None if there is none
+        """
+        if not self.conflict and self.solution is None:
+            self._search(1)
+        return None if self.conflict else self.solution
+
+    def count_solutions(self, limit: int = 2) -> int:
+        """
+        Count solutions, stopping at limit
+        The default limit is enough to tell a unique puzzle (1) from an ambiguous one (2)
+        """
+        if self.conflict:
+            return 0
+        return self._search(limit)
+
+
+def solve_timed(puzzle) -> tuple[list[str] | None, float]:
+    """
+    :return: solution of one puzzle & seconds spent on it
+    """
+    start = perf_counter()
+    solution = SudokuSolver(puzzle).solve()
+    return solution, perf_counter() - start
+
+
+def solve_many(puzzles, workers: int = None, chunksize: int = 64) -> list[tuple[list[str] | None, float]]:
+    """
+    Solve puzzles across a pool of processes
+    :return: (solution, seconds) of every puzzle, in input order
+    """
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(solve_timed, puzzles, chunksize=chunksize))
+
+
+def read_boards(lines):
+    """
+    Yield (line number, 81-character board) from 81-character lines or blocks of 9 lines
+    Whitespace inside a line, blank lines & # comments are ignored
+    Lines of any other length are passed on as they are and fail validation
+    """
+    block, first = [], 0
+    for line_no, line in enumerate(lines, 1):
+        line = ''.join(line.split())
+        if not line or line.startswith('#'):
+            continue
+        if len(line) == 9:
+            if not block:
+                first = line_no
+            block.append(line)
+            if len(block) == 9:
+                yield first, ''.join(block)
+                block = []
+        else:
+            yield line_no, line
+    if block:
+        yield first, ''.join(block)
+
+
+def find_invalid(chunk: list[tuple[int, str]]) -> list[tuple[int, str]]:
+    """
+    Worker side of validate_stream: the (line number, board) pairs of a chunk that are not valid
+    """
+    invalid = []
+    for line_no, board in chunk:
+        if len(board) != 81 or not SudokuValidator(
+            [board[z * 9:z * 9 + 9] for z in range(9)]
+        ).is_valid():
+            invalid.append((line_no, board))
+    return invalid
+
+
+def validate_stream(boards, workers: int = None, chunk_size: int = CHUNK_SIZE):
+    """
+    Validate a stream of (line number, board) in chunks across worker processes
+    At most two chunks per worker are in flight, so memory use does not grow with the input
+    Yield (boards checked, invalid boards) per chunk, in input order
+    """
+    workers = workers or cpu_count() or 1
+    boards = iter(boards)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        while chunk := list(islice(boards, chunk_size)):
+            pending.append((len(chunk), pool.submit(find_invalid, chunk)))
+            if len(pending) >= 2 * workers:
+                count, job = pending.popleft()
+                yield count, job.result()
+        while pending:
+            count, job = pending.popleft()
+            yield count, job.result()
+
+
+def run_cli(argv: list[str]):
+    """
+    Headless validation of files or stdin, nothing gets drawn
+    Invalid boards go to stdout, the summary to stderr
+    """
+    parser = argparse.ArgumentParser(
+        description='Validate Sudoku boards given as 81-character lines or blocks of 9 lines'
+    )
+    parser.add_argument('files', nargs='*', help='- or no file reads stdin')
+    parser.add_argument('--workers', type=int, help='processes, defaults to the number of cores')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='boards per task')
+    parser.add_argument('--summary', action='store_true', help='do not list invalid boards')
+    args = parser.parse_args(argv)
+
+    start = perf_counter()
+    total = failed = 0
+    for path in args.files or ['-']:
+        source = sys.stdin if path == '-' else open(path)
+        with source:
+            for count, invalid in validate_stream(read_boards(source), args.workers, args.chunk_size):
+                total += count
+                failed += len(invalid)
+                if not args.summary:
+                    sys.stdout.writelines(f'{path}:{line_no}: {board}\n' for line_no, board in invalid)
+    elapsed = perf_counter() - start
+    print(
+        f'{total} boards, {total - failed} valid, {failed} invalid '
+        f'in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} boards/s)',
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        raise SystemExit(run_cli(sys.argv[1:]))
+
+    # test case variables
+    valid = [
+        "295743861",
+        "431865927",
+        "876192543",
+        "387459216",
+        "612387495",
+        "549216738",
+        "763524189",
+        "928671354",
+        "154938672",
+    ]
+
+    invalid = [
+        "195743862",
+        "431865927",
+        "876192543",
+        "387459216",
+        "612387495",
+        "549216738",
+        "763524189",
+        "928671354",
+        "254938671",
+    ]
+
+    board1 = SudokuValidator(valid)
+    board1.validation()
+    board2 = SudokuValidator(invalid)
+    board2.validation()
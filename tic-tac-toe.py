@@ -1,8 +1,13 @@
-from random import choice
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
 from copy import deepcopy
 from os import system
 from platform import platform
 from pdb import set_trace
+from sys import argv
+from time import perf_counter
 
 
 class TicTacToe:
@@ -13,7 +18,7 @@ class TicTacToe:
     new_board = [["1", "2", "3"], ["4", "5", "6"], ["7", "8", "9"]]
 
     # win combination template
-    # the first key to have all values replaced with either 'X' or 'O' will end the game
+    # the first line to be fully taken by either 'X' or 'O' will end the game
     new_combo_map = {
         "row_top": ["1", "2", "3"],
         "row_mid": ["4", "5", "6"],
@@ -27,14 +32,86 @@ class TicTacToe:
     # player tokens
     tokens = {"Computer": "X", "You": "O"}
 
-    def __init__(self):
+    # bitboards: bit n-1 stands for square n, one 9-bit integer per token
+    full_mask = 0b111111111
+    line_masks = {
+        combo_key: sum(1 << (int(x) - 1) for x in combo)
+        for combo_key, combo in new_combo_map.items()
+    }
+
+    # perfect play table, filled once by solve_positions()
+    # a position is the base-3 number with digit n-1 holding square n: 0 free, 1 "X", 2 "O"
+    token_values = {"X": 1, "O": 2}
+    powers = [3 ** n for n in range(9)]
+    # best square index 0 - 8 (255 when the game is over) & score for the side to move:
+    # positive win, 0 draw, negative loss, the sooner the bigger
+    best_moves: bytearray = None
+    scores: array = None
+
+    @classmethod
+    def solve_positions(cls):
+        """
+        Walk every position reachable from the empty board once with negamax
+        "You" ("O") moves first, so "O" is to move whenever both have the same number of squares
+        """
+        if cls.best_moves is not None:
+            return
+        lines = [[int(x) - 1 for x in combo] for combo in cls.new_combo_map.values()]
+        best_moves = bytearray([255]) * 3 ** 9
+        scores = array('b', [0]) * 3 ** 9
+        solved = bytearray(3 ** 9)
+
+        def negamax(code: int, cells: list[int], mover: int) -> int:
+            if solved[code]:
+                return scores[code]
+            last = 3 - mover
+            free = [z for z in range(9) if not cells[z]]
+            if any(all(cells[z] == last for z in line) for line in lines):
+                # the previous move won
+                score = -(len(free) + 1)
+            else:
+                score = 0 if not free else -100
+                for z in free:
+                    cells[z] = mover
+                    reply = -negamax(code + mover * cls.powers[z], cells, last)
+                    cells[z] = 0
+                    if reply > score:
+                        score = reply
+                        best_moves[code] = z
+            scores[code] = score
+            solved[code] = 1
+            return score
+
+        negamax(0, [0] * 9, cls.token_values["O"])
+        cls.best_moves, cls.scores = best_moves, scores
+
+    def __init__(self, perfect: bool = True, rng: Random = None):
         self.op_sys = platform()
+        # bot plays from the perfect play table instead of the heuristics
+        self.perfect = perfect
+        # random source of the heuristic bot, seeded by the simulator for repeatable runs
+        self.rng = rng if rng is not None else Random()
+        self.position = 0
+        if perfect:
+            TicTacToe.solve_positions()
         self.board: list[list[str]] = deepcopy(TicTacToe.new_board)
-        self.combo_map: dict[str, list[str]] = deepcopy(TicTacToe.new_combo_map)
-        self.free_squares: list[str] = [str(x) for x in range(1, 10)]
+        self.bits: dict[str, int] = {"X": 0, "O": 0}
         self.player_winning_combo: list[str] = []
         self.comp_winning_combo: list[str] = []
 
+    @property
+    def free_mask(self) -> int:
+        return TicTacToe.full_mask & ~(self.bits["X"] | self.bits["O"])
+
+    @property
+    def free_squares(self) -> list[str]:
+        free = self.free_mask
+        return [str(n + 1) for n in range(9) if free >> n & 1]
+
+    @staticmethod
+    def squares_of(mask: int) -> list[str]:
+        return [str(n + 1) for n in range(9) if mask >> n & 1]
+
     def display_board(self):
         """
         Clear the screen and draw the game board in place with updated move
@@ -81,78 +158,91 @@ class TicTacToe:
         """
         Draw the computer's move and update the board
         """
+        if self.perfect:
+            return self.perfect_move(), "X"
+        return self.heuristic_move("X"), "X"
+
+    def perfect_move(self) -> str:
+        """
+        Best square for whoever is to move, from the perfect play table
+        """
+        return str(TicTacToe.best_moves[self.position] + 1)
+
+    def heuristic_move(self, token: str) -> str:
+        """
+        Win if possible, else block the rival's win, else extend a line of our own
+        """
+        rival = "O" if token == "X" else "X"
+        own_threats, rival_threats = self.comp_winning_combo, self.player_winning_combo
+        if token == "O":
+            own_threats, rival_threats = rival_threats, own_threats
+        free = self.free_mask
+
         # go for the win!
-        if len(self.comp_winning_combo) != 0:
-            key = self.comp_winning_combo[0]
-            for x in self.combo_map[key]:
-                if x.isdigit():
-                    return x, "X"
+        if len(own_threats) != 0:
+            key = own_threats[0]
+            return str((TicTacToe.line_masks[key] & free).bit_length())
 
         # prevent win
-        elif len(self.player_winning_combo) != 0:
-            key = self.player_winning_combo[0]
-            for x in self.combo_map[key]:
-                if x.isdigit():
-                    return x, "X"
+        elif len(rival_threats) != 0:
+            key = rival_threats[0]
+            return str((TicTacToe.line_masks[key] & free).bit_length())
 
         else:
-            # get the current best choices
-            temp_options = []
-            for combo_key, combo in self.combo_map.items():
-                if "X" in combo and "O" not in combo:
-                    for x in combo:
-                        if x.isdigit():
-                            temp_options.append(x)
-
-            if len(temp_options) != 0:
-                return choice(temp_options), "X"
+            # get the current best choices: free squares on lines with our token and none of the rival's
+            options = 0
+            for mask in TicTacToe.line_masks.values():
+                if self.bits[token] & mask and not self.bits[rival] & mask:
+                    options |= mask & free
+
+            if options:
+                return self.rng.choice(TicTacToe.squares_of(options))
             else:
-                return choice(self.free_squares), "X"
+                return self.rng.choice(self.free_squares)
 
     def update_tables(self, board_number, token):
         """
-        Update win combination table
-        Replace the game board numbered square with token - "X" or "O"
-        Remove tagged number from free_squares
+        Set the square bit of the token - "X" or "O"
+        Replace the game board numbered square with token
+        Refresh the lines one move away from a win
         """
-        # remove the square number last tagged
-        self.free_squares.remove(board_number)
+        square = int(board_number) - 1
+        self.bits[token] |= 1 << square
+        self.position += TicTacToe.token_values[token] * TicTacToe.powers[square]
 
         # game board
-        for row in range(3):
-            if board_number in self.board[row]:
-                index = self.board[row].index(board_number)
-                self.board[row][index] = token
-                break
-
-        # combo table
-        for combo_key, combo in self.combo_map.items():
-            if board_number in combo:
-                index = combo.index(board_number)
-                combo[index] = token
-                self.combo_map[combo_key] = combo
+        self.board[square // 3][square % 3] = token
 
         # refresh list of current winning moves
-        self.player_winning_combo: list[str] = []
-        self.comp_winning_combo: list[str] = []
+        x_bits, o_bits = self.bits["X"], self.bits["O"]
+        self.player_winning_combo: list[str] = [
+            combo_key for combo_key, mask in TicTacToe.line_masks.items()
+            if (o_bits & mask).bit_count() == 2 and not x_bits & mask
+        ]
+        self.comp_winning_combo: list[str] = [
+            combo_key for combo_key, mask in TicTacToe.line_masks.items()
+            if (x_bits & mask).bit_count() == 2 and not o_bits & mask
+        ]
 
-        for combo_key, combo in self.combo_map.items():
-            if combo.count("O") == 2:
-                if 'X' not in self.combo_map[combo_key]:
-                    self.player_winning_combo.append(combo_key)
-            elif combo.count("X") == 2:
-                if 'O' not in self.combo_map[combo_key]:
-                    self.comp_winning_combo.append(combo_key)
+    def winner(self) -> str | None:
+        """
+        Token owning a full line, None while nobody has won
+        """
+        for token, bits in self.bits.items():
+            for mask in TicTacToe.line_masks.values():
+                if bits & mask == mask:
+                    return token
+        return None
 
     def victory(self):
         """
         Analyze the board status and check if someone has won the game
         """
-        for win_move in self.combo_map.values():
-            for tag_owner, token in TicTacToe.tokens.items():
-                if win_move.count(token) == 3:
-                    print(tag_owner, " win!\n")
-                    return True
+        token = self.winner()
+        for tag_owner, tag_token in TicTacToe.tokens.items():
+            if tag_token == token:
+                print(tag_owner, " win!\n")
+                return True
         else:
             return False
 
@@ -174,10 +264,412 @@ class TicTacToe:
         return opt
 
             
+class KInARow:
+    """
+    N x N board where win_length tokens in a row, column or diagonal win
+    Cells hold 0 when free, 1 for the first player & 2 for the second
+    Every move updates the token count of each line segment (window) of win_length cells
+    through its square, which gives the winner, the static score & the Zobrist hash incrementally
+    """
+    def __init__(self, size: int = 15, win_length: int = 5, seed: int = 0):
+        self.size = size
+        self.win_length = win_length
+        # score of a window holding n tokens of a single player, one order of magnitude per token
+        self.weights = [0] + [10 ** n for n in range(1, win_length + 1)]
+        self.cells = [0] * (size * size)
+        self.to_move = 1
+        self.moves: list[int] = []
+        self.winner = 0
+        # static score from the first player's point of view
+        self.score = 0
+
+        self.windows: list[list[int]] = []
+        self.cell_windows: list[list[int]] = [[] for _ in self.cells]
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                    end_row = row + d_row * (win_length - 1)
+                    end_col = col + d_col * (win_length - 1)
+                    if 0 <= end_row < size and 0 <= end_col < size:
+                        window = [(row + d_row * n) * size + col + d_col * n for n in range(win_length)]
+                        for idx in window:
+                            self.cell_windows[idx].append(len(self.windows))
+                        self.windows.append(window)
+        # tokens of each player per window, index 0 unused
+        self.counts = [[0, 0, 0] for _ in self.windows]
+
+        rng = Random(seed)
+        self.zobrist = [[0, rng.getrandbits(64), rng.getrandbits(64)] for _ in self.cells]
+        self.side_key = rng.getrandbits(64)
+        self.hash = 0
+
+    def window_value(self, counts: list[int]) -> int:
+        if counts[1] and counts[2]:
+            return 0
+        if counts[1]:
+            return self.weights[counts[1]]
+        return -self.weights[counts[2]]
+
+    def play(self, idx: int):
+        player = self.to_move
+        for w in self.cell_windows[idx]:
+            counts = self.counts[w]
+            self.score -= self.window_value(counts)
+            counts[player] += 1
+            self.score += self.window_value(counts)
+            if counts[player] == self.win_length:
+                self.winner = player
+        self.cells[idx] = player
+        self.hash ^= self.zobrist[idx][player] ^ self.side_key
+        self.moves.append(idx)
+        self.to_move = 3 - player
+
+    def undo(self):
+        idx = self.moves.pop()
+        player = 3 - self.to_move
+        for w in self.cell_windows[idx]:
+            counts = self.counts[w]
+            self.score -= self.window_value(counts)
+            if counts[player] == self.win_length:
+                self.winner = 0
+            counts[player] -= 1
+            self.score += self.window_value(counts)
+        self.cells[idx] = 0
+        self.hash ^= self.zobrist[idx][player] ^ self.side_key
+        self.to_move = player
+
+    def full(self) -> bool:
+        return len(self.moves) == len(self.cells)
+
+    def candidates(self, radius: int = 2) -> list[int]:
+        """
+        Free squares within radius of a taken one, the centre on an empty board
+        """
+        if not self.moves:
+            return [(self.size // 2) * self.size + self.size // 2]
+        near = set()
+        for idx in self.moves:
+            row, col = divmod(idx, self.size)
+            for r in range(max(0, row - radius), min(self.size, row + radius + 1)):
+                for c in range(max(0, col - radius), min(self.size, col + radius + 1)):
+                    if not self.cells[r * self.size + c]:
+                        near.add(r * self.size + c)
+        return list(near)
+
+    def priority(self, idx: int) -> int:
+        """
+        How much a square matters to either player: its open windows weighted by their tokens
+        """
+        total = 0
+        for w in self.cell_windows[idx]:
+            counts = self.counts[w]
+            if not counts[2]:
+                total += self.weights[counts[1]]
+            if not counts[1]:
+                total += self.weights[counts[2]]
+        return total
+
+    def __str__(self) -> str:
+        marks = ".XO"
+        return "\n".join(
+            " ".join(marks[self.cells[row * self.size + col]] for col in range(self.size))
+            for row in range(self.size)
+        )
+
+
+class SearchTimeout(Exception):
+    """
+    Time or node budget of a move used up
+    """
+
+
+class AlphaBetaEngine:
+    """
+    Iterative deepening negamax with alpha-beta pruning over a KInARow board
+    Moves are ordered by the transposition table move, then by square priority
+    The transposition table is a fixed number of slots indexed by Zobrist hash, newer entries replace older
+    """
+    WIN = 1_000_000
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, time_limit: float = 1.0, node_limit: int = None, table_bits: int = 20):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.table_mask = (1 << table_bits) - 1
+        # slot: (hash, depth, score, flag, best move)
+        self.table: list[tuple] = [None] * (1 << table_bits)
+        self.nodes = 0
+        self.deadline = 0.0
+
+    def best_move(self, board: KInARow, time_limit: float = None, node_limit: int = None, max_depth: int = None) -> int:
+        """
+        Deepen one ply at a time until the budget runs out or the result is forced
+        A time_limit of 0 means no time limit, budgets left as None fall back to the engine's
+        :return: square index of the deepest completed search
+        """
+        time_limit = self.time_limit if time_limit is None else time_limit
+        node_limit = self.node_limit if node_limit is None else node_limit
+        self.deadline = perf_counter() + time_limit if time_limit else float("inf")
+        self.node_budget = node_limit or float("inf")
+        self.nodes = 0
+        played = len(board.moves)
+        best = self.ordered(board, None)[0]
+
+        for depth in range(1, (max_depth or len(board.cells) - played) + 1):
+            try:
+                score, move = self.search_root(board, depth)
+            except SearchTimeout:
+                # unwind the moves of the interrupted search
+                while len(board.moves) > played:
+                    board.undo()
+                break
+            best = move
+            if abs(score) >= AlphaBetaEngine.WIN - len(board.cells):
+                break
+        return best
+
+    def ordered(self, board: KInARow, first: int | None) -> list[int]:
+        moves = sorted(board.candidates(), key=board.priority, reverse=True)
+        if first is not None and first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def search_root(self, board: KInARow, depth: int) -> tuple[int, int]:
+        entry = self.table[board.hash & self.table_mask]
+        first = entry[4] if entry and entry[0] == board.hash else None
+        alpha, beta = -AlphaBetaEngine.WIN - 1, AlphaBetaEngine.WIN + 1
+        best_move = None
+        for move in self.ordered(board, first):
+            board.play(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            board.undo()
+            if best_move is None or score > alpha:
+                alpha, best_move = score, move
+        self.table[board.hash & self.table_mask] = (board.hash, depth, alpha, AlphaBetaEngine.EXACT, best_move)
+        return alpha, best_move
+
+    def negamax(self, board: KInARow, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes > self.node_budget or (not self.nodes & 1023 and perf_counter() > self.deadline):
+            raise SearchTimeout
+
+        if board.winner:
+            # the previous move won, the sooner the better for it
+            return -(AlphaBetaEngine.WIN - ply)
+        if board.full():
+            return 0
+        if not depth:
+            return board.score if board.to_move == 1 else -board.score
+
+        slot = board.hash & self.table_mask
+        entry = self.table[slot]
+        first = None
+        if entry and entry[0] == board.hash:
+            _, entry_depth, entry_score, flag, first = entry
+            if entry_depth >= depth:
+                if flag == AlphaBetaEngine.EXACT:
+                    return entry_score
+                if flag == AlphaBetaEngine.LOWER:
+                    alpha = max(alpha, entry_score)
+                elif flag == AlphaBetaEngine.UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        start_alpha = alpha
+        best_score, best_move = -AlphaBetaEngine.WIN - 1, None
+        for move in self.ordered(board, first):
+            board.play(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.undo()
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= start_alpha:
+            flag = AlphaBetaEngine.UPPER
+        elif best_score >= beta:
+            flag = AlphaBetaEngine.LOWER
+        else:
+            flag = AlphaBetaEngine.EXACT
+        self.table[slot] = (board.hash, depth, best_score, flag, best_move)
+        return best_score
+
+
+def play_k_in_a_row(size: int, win_length: int, time_limit: float = 1.0):
+    """
+    Play on a bigger board against the alpha-beta engine, moves are entered as "row col" from 1
+    """
+    board = KInARow(size, win_length)
+    engine = AlphaBetaEngine(time_limit)
+    marks = {1: "You", 2: "Computer"}
+    while not board.winner and not board.full():
+        print(board, "\n")
+        if board.to_move == 1:
+            o = input("Enter your move as row col!\n").split()
+            if len(o) != 2 or not all(x.isnumeric() for x in o):
+                print("This is not a row & column, try again!\n")
+                continue
+            row, col = int(o[0]) - 1, int(o[1]) - 1
+            if not (0 <= row < size and 0 <= col < size) or board.cells[row * size + col]:
+                print("Spot taken or off the board! Pick another!\n")
+                continue
+            board.play(row * size + col)
+        else:
+            board.play(engine.best_move(board))
+    print(board, "\n")
+    if board.winner:
+        print(marks[board.winner], " win!\n")
+    else:
+        print("IT'S A TIE!!!\n")
+
+
+# ~~~~~~~~~~~~~~~  HEADLESS SELF-PLAY ~~~~~~~~~~~~~~~ #
+
+# games played by one worker task
+SIMULATION_CHUNK = 10_000
+
+
+def make_player(spec: str):
+    """
+    Player from its name: perfect, heuristic, random or scripted:<squares> (e.g. scripted:5,1,9),
+    which takes the first free square of its script & plays randomly once the script runs out
+    Players take the game & their token and return a square number
+    """
+    if spec == "perfect":
+        return lambda game, token: game.perfect_move()
+    if spec == "heuristic":
+        return lambda game, token: game.heuristic_move(token)
+    if spec == "random":
+        return lambda game, token: game.rng.choice(game.free_squares)
+    if spec.startswith("scripted:"):
+        script = spec.split(":", 1)[1].split(",")
+
+        def scripted(game, token):
+            free = game.free_squares
+            for square in script:
+                if square in free:
+                    return square
+            return game.rng.choice(free)
+        return scripted
+    raise ValueError(f"Unknown player: {spec}")
+
+
+def simulate(o_spec: str, x_spec: str, games: int, seed: int) -> dict:
+    """
+    Play games without drawing anything, "O" always moves first
+    :return: wins per token, draws, and moves, thinking time & slowest move per token
+    """
+    TicTacToe.solve_positions()
+    players = {"O": make_player(o_spec), "X": make_player(x_spec)}
+    rng = Random(seed)
+    stats = {
+        "O": 0, "X": 0, "draw": 0,
+        "moves": {"O": 0, "X": 0},
+        "time": {"O": 0.0, "X": 0.0},
+        "slowest": {"O": 0.0, "X": 0.0},
+    }
+    for _ in range(games):
+        game = TicTacToe(perfect=x_spec == "perfect", rng=rng)
+        result = "draw"
+        while game.free_mask and result == "draw":
+            for token in ("O", "X"):
+                start = perf_counter()
+                square = players[token](game, token)
+                spent = perf_counter() - start
+                stats["moves"][token] += 1
+                stats["time"][token] += spent
+                stats["slowest"][token] = max(stats["slowest"][token], spent)
+                game.update_tables(square, token)
+                if game.winner():
+                    result = token
+                    break
+                if not game.free_mask:
+                    break
+        stats[result] += 1
+    return stats
+
+
+def self_play(o_spec: str, x_spec: str, games: int, workers: int = None, seed: int = 0) -> dict:
+    """
+    Spread games over a pool of processes in chunks seeded from seed, so a run can be repeated
+    :return: merged stats of simulate() plus games & elapsed seconds
+    """
+    TicTacToe.solve_positions()
+    chunks = [min(SIMULATION_CHUNK, games - start) for start in range(0, games, SIMULATION_CHUNK)]
+    start = perf_counter()
+    total = {
+        "O": 0, "X": 0, "draw": 0,
+        "moves": {"O": 0, "X": 0},
+        "time": {"O": 0.0, "X": 0.0},
+        "slowest": {"O": 0.0, "X": 0.0},
+    }
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = pool.map(
+            simulate,
+            [o_spec] * len(chunks), [x_spec] * len(chunks), chunks,
+            [seed + n for n in range(len(chunks))],
+        )
+        for stats in jobs:
+            for key in ("O", "X", "draw"):
+                total[key] += stats[key]
+            for token in ("O", "X"):
+                total["moves"][token] += stats["moves"][token]
+                total["time"][token] += stats["time"][token]
+                total["slowest"][token] = max(total["slowest"][token], stats["slowest"][token])
+    total["games"] = games
+    total["elapsed"] = perf_counter() - start
+    return total
+
+
+def run_simulation(args: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="tic-tac-toe.py simulate", description="Headless bot strength benchmark"
+    )
+    parser.add_argument("--o", default="random", help='"O" player, moves first (default: random)')
+    parser.add_argument("--x", default="perfect", help='"X" player (default: perfect)')
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, help="processes, defaults to the number of cores")
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+    for spec in (opts.o, opts.x):
+        try:
+            make_player(spec)
+        except ValueError as err:
+            parser.error(str(err))
+
+    stats = self_play(opts.o, opts.x, opts.games, opts.workers, opts.seed)
+    games = stats["games"]
+    print(f"{games} games in {stats['elapsed']:.2f}s ({games / stats['elapsed']:.0f} games/s)")
+    print(
+        f"X ({opts.x}) wins {stats['X'] / games:.2%}, draws {stats['draw'] / games:.2%}, "
+        f"loses {stats['O'] / games:.2%} against O ({opts.o})"
+    )
+    for token, spec in (("O", opts.o), ("X", opts.x)):
+        moves = stats["moves"][token]
+        mean = stats["time"][token] / moves if moves else 0.0
+        print(
+            f"{token} ({spec}) per move: mean {mean * 1e6:.1f}us, "
+            f"slowest {stats['slowest'][token] * 1e6:.1f}us over {moves} moves"
+        )
+
+
 # ~~~~~~~~~~~~~~~  PLAY GAME ~~~~~~~~~~~~~~~ #
 
 if __name__ == "__main__":
-    
+    # python tic-tac-toe.py simulate [--help] benchmarks bots against each other without a screen
+    if len(argv) > 1 and argv[1] == "simulate":
+        run_simulation(argv[2:])
+        raise SystemExit
+
+    # python tic-tac-toe.py <board size> <win length> plays a bigger board against the alpha-beta engine
+    if len(argv) == 3:
+        play_k_in_a_row(int(argv[1]), int(argv[2]))
+        raise SystemExit
+
     while True:
         game = TicTacToe()
         game.display_board()     